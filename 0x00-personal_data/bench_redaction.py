@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of filter_datum against the per-call regex it replaced
+
+Usage: python3 bench_redaction.py [number of lines]
+"""
+
+import re
+import sys
+import timeit
+from typing import List
+
+from filtered_logger import filter_datum
+
+
+def regex_filter_datum(fields: List[str],
+                       redaction: str, message: str, separator: str) -> str:
+    """filter_datum before the cached engine: one regex built per call"""
+    pattern = "|".join(fr'(?<={field}=)[^{separator}]*' for field in fields)
+    return re.sub(pattern, redaction, message)
+
+
+def log_lines(pii_count: int, count: int) -> List[str]:
+    """Log lines with pii_count PII fields among as many other fields"""
+    lines = []
+    for i in range(count):
+        values = []
+        for j in range(pii_count):
+            values.append("pii_{}=value-{}-{}@example.com".format(j, i, j))
+            values.append("field_{}={}".format(j, i * j))
+        lines.append("[HOLBERTON] user_data INFO 2019-11-19 18:37:59,596: "
+                     + ";".join(values) + ";")
+    return lines
+
+
+def main():
+    """Time both implementations for 5 to 50 PII fields"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print("{} lines per run".format(count))
+    for pii_count in (5, 10, 20, 50):
+        fields = ["pii_{}".format(j) for j in range(pii_count)]
+        lines = log_lines(pii_count, count)
+        for line in lines[:10]:
+            if filter_datum(fields, "***", line, ";") != \
+                    regex_filter_datum(fields, "***", line, ";"):
+                raise AssertionError("outputs differ")
+        timings = []
+        for fn in (regex_filter_datum, filter_datum):
+            timings.append(min(timeit.repeat(
+                lambda: [fn(fields, "***", line, ";") for line in lines],
+                number=1, repeat=5)))
+        print("{:>2} PII fields  regex: {:>8.2f} us/line  cached: {:>8.2f} "
+              "us/line  speedup: x{:.1f}".format(
+                  pii_count, timings[0] * 1e6 / count,
+                  timings[1] * 1e6 / count, timings[0] / timings[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,43 @@
 #!/usr/bin/env python3
 """Encrypt Password"""
 
+from functools import lru_cache
 import bcrypt
+import os
+import time
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int = 10,
+                     max_rounds: int = 16) -> int:
+    """Returns the highest bcrypt cost whose hash takes at most
+    target_ms on this machine, within [min_rounds, max_rounds]"""
+    # each round doubles the work: time a cheap cost and extrapolate
+    probe = 6
+    salt = bcrypt.gensalt(probe)
+    elapsed = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    rounds = min_rounds
+    while rounds < max_rounds \
+            and elapsed * 1000 * 2 ** (rounds + 1 - probe) <= target_ms:
+        rounds += 1
+    return rounds
+
+
+@lru_cache(maxsize=None)
+def bcrypt_rounds() -> int:
+    """Cost of new hashes: BCRYPT_ROUNDS if set, else calibrated once
+    for BCRYPT_TARGET_MS (default 250)"""
+    if os.getenv('BCRYPT_ROUNDS'):
+        return int(os.getenv('BCRYPT_ROUNDS'))
+    return calibrate_rounds(float(os.getenv('BCRYPT_TARGET_MS', 250)))
 
 
 def hash_password(password: str) -> bytes:
     """Hashes a password and returns bytes"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(bcrypt_rounds())
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed_password
 
@@ -15,3 +46,10 @@ def is_valid(hashed_password: bytes, password: str) -> bool:
     """Validates that the provided password
     matches the hashed password."""
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """Whether a hash was made with a lower cost than bcrypt_rounds():
+    a host calibrating a lower cost never downgrades stronger hashes"""
+    # $2b$<cost>$<salt and hash>
+    return int(hashed_password.split(b"$")[2]) < bcrypt_rounds()
@@ -1,27 +1,100 @@
 #!/usr/bin/env python3
 """Logging PII data"""
 
+import argparse
+import atexit
+from functools import lru_cache
 import logging
+import queue
 import re
 import os
+import sys
+import threading
+import time
 import mysql.connector
 from mysql.connector import connection
-from typing import List,  Tuple
+from typing import Any, Callable, List, Optional,  Tuple
 
 
 # Define the PII_FIELDS tuple with the fields considered as PII
 PII_FIELDS: Tuple[str, ...] = ("name", "email", "phone", "ssn", "password")
 
+# characters with a meaning in the regex built from the fields, and in
+# the [^separator] character class
+REGEX_SPECIAL = frozenset(".^$*+?{}[]\\|()")
+CLASS_SPECIAL = frozenset("[]\\^-")
+
+
+@lru_cache(maxsize=128)
+def redactor(fields: Tuple[str, ...],
+             separator: str) -> Callable[[str, str], str]:
+    """Returns a function (redaction, message) -> redacted message for
+    fields and separator, built once per pair.
+    The output is the one of re.sub with one look-behind per field:
+    each value starting right after "<field>=" is replaced up to the
+    next separator character."""
+    pattern = re.compile("|".join(fr'(?<={field}=)[^{separator}]*'
+                                  for field in fields))
+    if not fields or not separator \
+            or any(c in REGEX_SPECIAL for field in fields for c in field) \
+            or any(c in CLASS_SPECIAL for c in separator):
+        # fields or separator are regular expressions, not plain text
+        return lambda redaction, message: pattern.sub(redaction, message)
+
+    # "=" positions are checked against the fields of each length
+    by_length = {}
+    for field in fields:
+        by_length.setdefault(len(field), set()).add(field)
+    lengths = sorted(by_length.items())
+    separators = set(separator)
+
+    def value_end(message: str, start: int) -> int:
+        """Index of the first separator character from start"""
+        end = len(message)
+        for character in separators:
+            # only look before the closest separator found so far
+            index = message.find(character, start, end)
+            if index != -1:
+                end = index
+        return end
+
+    def redact(redaction: str, message: str) -> str:
+        """Redacts message in one pass"""
+        if "\\" in redaction:
+            # escapes and group references of re.sub
+            return pattern.sub(redaction, message)
+        pieces = []
+        last = 0
+        equal = message.find("=")
+        while equal != -1:
+            for length, names in lengths:
+                if length <= equal and message[equal - length:equal] in names:
+                    break
+            else:
+                equal = message.find("=", equal + 1)
+                continue
+            start = equal + 1
+            end = value_end(message, start)
+            pieces.append(message[last:start])
+            pieces.append(redaction)
+            last = end
+            # like re.sub, an empty value may follow a non-empty one
+            position = end if end > start else end + 1
+            equal = message.find("=", position - 1)
+        pieces.append(message[last:])
+        return "".join(pieces)
+
+    return redact
+
 
 def filter_datum(fields: List[str],
                  redaction: str, message: str, separator: str) -> str:
     """Returns log message obfuscated"""
-    pattern = "|".join(fr'(?<={field}=)[^{separator}]*' for field in fields)
-    return re.sub(pattern, redaction, message)
+    return redactor(tuple(fields), separator)(redaction, message)
 
 
-def get_db() -> connection.MySQLConnection:
-    """Connect to the MySQL database and return the connection object."""
+def connect_db() -> connection.MySQLConnection:
+    """Open a new connection to the MySQL database."""
     username = os.getenv('PERSONAL_DATA_DB_USERNAME', 'root')
     password = os.getenv('PERSONAL_DATA_DB_PASSWORD', '')
     host = os.getenv('PERSONAL_DATA_DB_HOST', 'localhost')
@@ -35,6 +108,170 @@ def get_db() -> connection.MySQLConnection:
     )
 
 
+class PooledConnection:
+    """Connection checked out of a ConnectionPool: close() gives it
+    back to the pool, everything else goes to the connection.
+    Used in a with statement, it is given back on exit."""
+
+    def __init__(self, pool: 'ConnectionPool', conn: Any, created: float):
+        """initialize instance"""
+        self._pool = pool
+        self._conn = conn
+        self._created = created
+
+    def __getattr__(self, name: str) -> Any:
+        """attributes of the connection"""
+        if self._conn is None:
+            raise AttributeError("connection returned to its pool")
+        return getattr(self._conn, name)
+
+    def __enter__(self) -> 'PooledConnection':
+        """enter the context of the connection"""
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """give the connection back, even on errors"""
+        self.close()
+
+    def close(self) -> None:
+        """Return the connection to the pool"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.checkin(conn, self._created)
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of connections opened by connect.
+    Connections older than max_lifetime seconds are replaced, the ones
+    idle for more than check_idle seconds are checked with a SELECT 1
+    before being handed out, and checkout() waits at most timeout
+    seconds for one."""
+
+    def __init__(self, connect: Callable[[], Any], size: int = 5,
+                 max_lifetime: float = 3600, timeout: float = 10,
+                 check_idle: float = 30):
+        """initialize instance, connections are opened on demand"""
+        self.connect = connect
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.opened = 0
+        # (connection, creation time, last use time), most recent last
+        self._idle = []
+        self._condition = threading.Condition()
+
+    def checkout(self) -> PooledConnection:
+        """Returns a healthy connection, TimeoutError if none is free
+        within timeout"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._condition:
+                while not self._idle and self.opened >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 \
+                            or not self._condition.wait(remaining):
+                        raise TimeoutError("no free database connection")
+                if self._idle:
+                    conn, created, used = self._idle.pop()
+                else:
+                    conn = None
+                    self.opened += 1
+            if conn is None:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    self._discard(None)
+                    raise
+                return PooledConnection(self, conn, time.monotonic())
+            now = time.monotonic()
+            if now - created < self.max_lifetime \
+                    and (now - used < self.check_idle or self._alive(conn)):
+                return PooledConnection(self, conn, created)
+            self._discard(conn)
+
+    @staticmethod
+    def _alive(conn: Any) -> bool:
+        """Whether the server still answers on conn"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def checkin(self, conn: Any, created: float) -> None:
+        """Take back a connection, rolled back to a clean state"""
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._condition:
+            self._idle.append((conn, created, time.monotonic()))
+            self._condition.notify()
+
+    def _discard(self, conn: Any) -> None:
+        """Close a connection and free its slot"""
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        with self._condition:
+            self.opened -= 1
+            self._condition.notify()
+
+    def close(self) -> None:
+        """Close the idle connections"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for conn, _, _ in idle:
+            self._discard(conn)
+
+
+# pool used by get_db, created on first use when
+# PERSONAL_DATA_DB_POOL_SIZE > 0 (or set with another connect function)
+DB_POOL: Optional[ConnectionPool] = None
+DB_POOL_LOCK = threading.Lock()
+
+
+def env_number(name: str, default: float, kind: type = float) -> Any:
+    """Value of the environment variable name converted by kind,
+    ValueError naming the variable when it is not a number"""
+    value = os.getenv(name, default)
+    try:
+        return kind(value)
+    except ValueError:
+        raise ValueError("{} must be {}, got {!r}".format(
+            name, "an integer" if kind is int else "a number",
+            value)) from None
+
+
+def get_db() -> connection.MySQLConnection:
+    """Connect to the MySQL database and return the connection object.
+    With PERSONAL_DATA_DB_POOL_SIZE > 0, the connection comes from
+    DB_POOL (see ConnectionPool) and close() gives it back; the pool is
+    tuned by PERSONAL_DATA_DB_POOL_MAX_LIFETIME,
+    PERSONAL_DATA_DB_POOL_TIMEOUT and PERSONAL_DATA_DB_POOL_CHECK_IDLE
+    (seconds)."""
+    global DB_POOL
+    if DB_POOL is None:
+        size = env_number('PERSONAL_DATA_DB_POOL_SIZE', 0, int)
+        if size <= 0:
+            return connect_db()
+        with DB_POOL_LOCK:
+            if DB_POOL is None:
+                DB_POOL = ConnectionPool(
+                    connect_db, size,
+                    env_number('PERSONAL_DATA_DB_POOL_MAX_LIFETIME', 3600),
+                    env_number('PERSONAL_DATA_DB_POOL_TIMEOUT', 10),
+                    env_number('PERSONAL_DATA_DB_POOL_CHECK_IDLE', 30))
+    return DB_POOL.checkout()
+
+
 class RedactingFormatter(logging.Formatter):
     """ Redacting Formatter class
         """
@@ -54,41 +291,232 @@ class RedactingFormatter(logging.Formatter):
                             self.SEPARATOR)
 
 
-def get_logger() -> logging.Logger:
-    """Creates and returns a logger object."""
+class AsyncHandler(logging.Handler):
+    """Handler that only enqueues records: a background thread formats
+    (redacts) and writes them by batches through a target handler.
+    When the queue is full, records are dropped (and counted) or the
+    caller waits, depending on block. Once closed, records are dropped."""
+
+    def __init__(self, target: logging.Handler, queue_size: int = 10000,
+                 block: bool = False, batch_size: int = 256):
+        """initialize instance and start the writer thread"""
+        super(AsyncHandler, self).__init__()
+        self.target = target
+        self.block = block
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        # emit() runs on the threads of the callers
+        self._counts_lock = threading.Lock()
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_records,
+                                        name="AsyncHandler", daemon=True)
+        self._writer.start()
+        # flush what is still queued when the program exits
+        atexit.register(self.close)
+
+    @property
+    def queued(self) -> int:
+        """Number of records waiting to be written"""
+        return self.queue.qsize()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Enqueue a record, the caller does not redact nor write"""
+        try:
+            # handle() holds self.lock, so close() cannot slip the
+            # sentinel in between this check and the put below
+            if self._closed:
+                with self._counts_lock:
+                    self.dropped += 1
+                return
+            # arguments may be mutated by the caller once we return
+            record.msg = record.getMessage()
+            record.args = None
+            try:
+                if self.block:
+                    self.queue.put(record)
+                else:
+                    self.queue.put_nowait(record)
+            except queue.Full:
+                with self._counts_lock:
+                    self.dropped += 1
+                return
+            with self._counts_lock:
+                self.enqueued += 1
+        except Exception:
+            self.handleError(record)
+
+    def _write_records(self) -> None:
+        """Writer thread: drains the queue by batches until None"""
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [record for record in batch if record is not None]
+            running = len(records) == len(batch)
+            try:
+                self._write_batch(records)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _write_batch(self, records: List[logging.LogRecord]) -> None:
+        """Format records and write them, with a single write and flush
+        for a stream handler"""
+        if not records:
+            return
+        target = self.target
+        if not isinstance(target, logging.StreamHandler):
+            for record in records:
+                target.handle(record)
+            self.written += len(records)
+            return
+        lines = []
+        for record in records:
+            try:
+                lines.append(target.format(record) + target.terminator)
+            except Exception:
+                target.handleError(record)
+        with target.lock:
+            try:
+                target.stream.write("".join(lines))
+                target.flush()
+            except Exception:
+                target.handleError(records[-1])
+        self.written += len(lines)
+
+    def flush(self) -> None:
+        """Wait until all the queued records are written"""
+        if not self._closed:
+            self.queue.join()
+
+    def close(self) -> None:
+        """Write the queued records and stop the writer thread"""
+        self.acquire()
+        try:
+            closing = not self._closed
+            self._closed = True
+        finally:
+            self.release()
+        if closing:
+            self.queue.put(None)
+            self._writer.join()
+            self.target.close()
+            atexit.unregister(self.close)
+        super(AsyncHandler, self).close()
+
+
+def get_logger(asynchronous: Optional[bool] = None) -> logging.Logger:
+    """Creates and returns a logger object.
+    With asynchronous (default: PERSONAL_DATA_LOG_ASYNC=1), logging
+    calls only enqueue records, see AsyncHandler; the queue holds
+    PERSONAL_DATA_LOG_QUEUE_SIZE records (default 10000) and
+    PERSONAL_DATA_LOG_POLICY tells what to do when it is full: drop
+    (default) or block.
+    Calling it again reuses the handler installed by the previous call
+    (one writer thread per logger), unless the mode changed."""
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
 
+    if asynchronous is None:
+        asynchronous = os.getenv('PERSONAL_DATA_LOG_ASYNC', '0') == '1'
+    for handler in list(logger.handlers):
+        if isinstance(handler, AsyncHandler):
+            if asynchronous and not handler._closed:
+                return logger
+        elif isinstance(handler.formatter, RedactingFormatter):
+            if not asynchronous:
+                return logger
+        else:
+            continue
+        logger.removeHandler(handler)
+        handler.close()
+
     stream_handler = logging.StreamHandler()
 
     formatter = RedactingFormatter(fields=list(PII_FIELDS))
     stream_handler.setFormatter(formatter)
 
-    logger.addHandler(stream_handler)
+    if asynchronous:
+        queue_size = int(os.getenv('PERSONAL_DATA_LOG_QUEUE_SIZE', 10000))
+        block = os.getenv('PERSONAL_DATA_LOG_POLICY', 'drop') == 'block'
+        logger.addHandler(AsyncHandler(stream_handler, queue_size, block))
+    else:
+        logger.addHandler(stream_handler)
 
     return logger
 
 
-def main():
-    """Main function to connect to the database and log user data."""
+def fetch_batches(cursor, batch_size: int, batches: queue.Queue) -> None:
+    """Puts the rows of an executed query in batches, then None.
+    Blocks while the queue is full so memory stays bounded."""
+    try:
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            batches.put(rows)
+    except Exception as error:
+        batches.put(error)
+    finally:
+        batches.put(None)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Main function to connect to the database and log user data.
+    Rows are streamed: a thread fetches batches from an unbuffered
+    cursor while the previous ones are redacted and written."""
+    parser = argparse.ArgumentParser(description="Log the users table "
+                                     "with its PII fields redacted")
+    parser.add_argument("--batch-size", type=int, default=1000,
+                        help="rows fetched per round trip")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="batches fetched ahead of the writer")
+    args = parser.parse_args(argv)
+
     logger = get_logger()
     db = get_db()
-    cursor = db.cursor()
+    cursor = db.cursor(buffered=False)
 
     query = "SELECT * FROM users"
     cursor.execute(query)
 
     columns = [desc[0] for desc in cursor.description]
 
-    for row in cursor.fetchall():
-        row_dict = dict(zip(columns, row))
-        log_message = "; ".join(f"{key}={value}" for key,
-                                value in row_dict.items())
-        logger.info(log_message)
+    batches = queue.Queue(maxsize=max(args.queue_size, 1))
+    fetcher = threading.Thread(target=fetch_batches,
+                               args=(cursor, max(args.batch_size, 1),
+                                     batches),
+                               daemon=True)
+    start = time.perf_counter()
+    count = 0
+    fetcher.start()
+    while True:
+        rows = batches.get()
+        if rows is None:
+            break
+        if isinstance(rows, Exception):
+            raise rows
+        for row in rows:
+            row_dict = dict(zip(columns, row))
+            log_message = "; ".join(f"{key}={value}" for key,
+                                    value in row_dict.items())
+            logger.info(log_message)
+        count += len(rows)
+    fetcher.join()
+    elapsed = time.perf_counter() - start
 
     cursor.close()
     db.close()
+    print("{} rows in {:.2f}s ({:.0f} rows/s)".format(
+        count, elapsed, count / elapsed if elapsed else 0), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Redact the PII fields of a log file on all cores
+
+Usage: python3 redact_logs.py [-o OUTPUT] [--workers N] INPUT
+
+The input is memory-mapped and split in chunks on line boundaries; the
+chunks are redacted by a pool of processes and written in their
+original order. Each line is redacted like RedactingFormatter does.
+"""
+
+import argparse
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+
+# mapped input of a worker process, see open_input
+INPUT = None
+
+
+def chunk_bounds(mm: mmap.mmap, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """Yields (start, end) offsets of chunks of about chunk_size bytes
+    ending at the end of a line"""
+    size = len(mm)
+    start = 0
+    while start < size:
+        end = min(start + chunk_size, size)
+        if end < size:
+            newline = mm.find(b"\n", end - 1)
+            end = size if newline == -1 else newline + 1
+        yield start, end
+        start = end
+
+
+def open_input(file_path: str, fields: List[str], separator: str,
+               redaction: str) -> None:
+    """Worker initializer: maps the input once per process"""
+    global INPUT
+    with open(file_path, 'rb') as f:
+        # an empty file cannot be mapped
+        mm = b"" if os.fstat(f.fileno()).st_size == 0 \
+            else mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    INPUT = (mm, fields, separator, redaction)
+
+
+def redact_chunk(bounds: Tuple[int, int]) -> bytes:
+    """Redacts the lines of a chunk of the input"""
+    mm, fields, separator, redaction = INPUT
+    start, end = bounds
+    # invalid UTF-8 is kept byte for byte
+    text = mm[start:end].decode('utf-8', 'surrogateescape')
+    # a value also ends at the end of its line
+    text = filter_datum(fields, redaction, text, separator + "\n")
+    return text.encode('utf-8', 'surrogateescape')
+
+
+def main(argv: Optional[List[str]] = None):
+    """Redacts INPUT into OUTPUT (default: standard output)"""
+    parser = argparse.ArgumentParser(description="Redact the PII fields "
+                                     "of a log file")
+    parser.add_argument("input", help="log file to redact")
+    parser.add_argument("-o", "--output", help="redacted log file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="redacting processes")
+    parser.add_argument("--chunk-size", type=int, default=4,
+                        help="size of the chunks in MiB")
+    parser.add_argument("--fields", default=",".join(PII_FIELDS),
+                        help="comma-separated fields to redact")
+    parser.add_argument("--separator", default=RedactingFormatter.SEPARATOR,
+                        help="character(s) ending a value")
+    args = parser.parse_args(argv)
+    fields = args.fields.split(",")
+    settings = (args.input, fields, args.separator,
+                RedactingFormatter.REDACTION)
+
+    start = time.perf_counter()
+    size = 0
+    with open(args.input, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            bounds = []
+        else:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            bounds = list(chunk_bounds(mm, max(args.chunk_size, 1) << 20))
+            mm.close()
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        with multiprocessing.Pool(max(args.workers or 1, 1), open_input,
+                                  settings) as pool:
+            # imap keeps the order of the chunks
+            for chunk in pool.imap(redact_chunk, bounds):
+                out.write(chunk)
+                size += len(chunk)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+    elapsed = time.perf_counter() - start
+    print("{} bytes in {:.2f}s ({:.1f} MiB/s)".format(
+        size, elapsed, size / (1 << 20) / elapsed if elapsed else 0),
+        file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
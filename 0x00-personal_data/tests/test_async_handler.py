@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Tests of AsyncHandler and get_logger"""
+
+import atexit
+import io
+import logging
+import os
+import sys
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from filtered_logger import (AsyncHandler, PII_FIELDS,  # noqa: E402
+                             RedactingFormatter, get_logger)
+
+
+def make_record(msg: str) -> logging.LogRecord:
+    """A user_data INFO record"""
+    return logging.LogRecord("user_data", logging.INFO, __file__, 1,
+                             msg, None, None)
+
+
+class AsyncHandlerTest(unittest.TestCase):
+    """Records are written by the writer thread, none is lost silently"""
+
+    def make_handler(self, **kwargs) -> AsyncHandler:
+        """Handler writing redacted lines to self.stream"""
+        self.stream = io.StringIO()
+        target = logging.StreamHandler(self.stream)
+        target.setFormatter(RedactingFormatter(fields=list(PII_FIELDS)))
+        handler = AsyncHandler(target, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def test_write(self):
+        """Queued records are redacted and written by flush"""
+        handler = self.make_handler()
+        for i in range(10):
+            handler.handle(make_record("name=bob{};ip=1;".format(i)))
+        handler.flush()
+        lines = self.stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 10)
+        self.assertTrue(all("name=***;ip=1;" in line for line in lines))
+        self.assertEqual((handler.enqueued, handler.written), (10, 10))
+
+    def test_emit_after_close(self):
+        """Records emitted once closed are counted as dropped"""
+        handler = self.make_handler(queue_size=1, block=True)
+        handler.handle(make_record("name=bob;"))
+        handler.close()
+        done = threading.Event()
+
+        def log():
+            """emit twice: a queued record would fill the queue"""
+            handler.handle(make_record("name=eve;"))
+            handler.handle(make_record("name=eve;"))
+            done.set()
+        threading.Thread(target=log, daemon=True).start()
+        self.assertTrue(done.wait(5), "emit blocked on a closed handler")
+        self.assertEqual(handler.written, 1)
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(handler.queued, 0)
+
+    def test_close_releases_atexit(self):
+        """close() stops the writer thread and unregisters its hook"""
+        with mock.patch.object(atexit, "unregister") as unregister:
+            handler = self.make_handler()
+            handler.close()
+            handler.close()
+        self.assertFalse(handler._writer.is_alive())
+        unregister.assert_called_once_with(handler.close)
+
+
+class GetLoggerTest(unittest.TestCase):
+    """get_logger installs a single handler on the user_data logger"""
+
+    def setUp(self):
+        """start from a logger without handlers"""
+        self.logger = logging.getLogger("user_data")
+        self.addCleanup(self.remove_handlers)
+        self.remove_handlers()
+
+    def remove_handlers(self):
+        """remove and close the handlers of the logger"""
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+
+    def test_reuse_async_handler(self):
+        """Repeated calls share one writer thread"""
+        threads = threading.active_count()
+        for _ in range(5):
+            logger = get_logger(True)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertIsInstance(logger.handlers[0], AsyncHandler)
+        self.assertEqual(threading.active_count(), threads + 1)
+
+    def test_reuse_stream_handler(self):
+        """Repeated synchronous calls do not duplicate the lines"""
+        get_logger(False)
+        logger = get_logger(False)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertNotIsInstance(logger.handlers[0], AsyncHandler)
+
+    def test_switch_mode(self):
+        """Changing the mode replaces (and closes) the handler"""
+        handler = get_logger(True).handlers[0]
+        logger = get_logger(False)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertNotIsInstance(logger.handlers[0], AsyncHandler)
+        self.assertFalse(handler._writer.is_alive())
+
+    def test_replace_closed_handler(self):
+        """A closed handler is replaced by a working one"""
+        handler = get_logger(True).handlers[0]
+        handler.close()
+        logger = get_logger(True)
+        self.assertEqual(len(logger.handlers), 1)
+        self.assertIsNot(logger.handlers[0], handler)
+
+    def test_keep_other_handlers(self):
+        """Handlers added by the application are left alone"""
+        other = logging.NullHandler()
+        self.logger.addHandler(other)
+        get_logger(True)
+        logger = get_logger(False)
+        self.assertIn(other, logger.handlers)
+        self.assertEqual(len(logger.handlers), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""Tests of ConnectionPool, PooledConnection and get_db"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import closing
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import filtered_logger  # noqa: E402
+from filtered_logger import ConnectionPool, PooledConnection  # noqa: E402
+
+
+class FakeCursor:
+    """Cursor of a FakeConnection"""
+
+    def __init__(self, conn: 'FakeConnection'):
+        """initialize instance"""
+        self.conn = conn
+
+    def execute(self, query: str) -> None:
+        """Run a query, fails once the server is gone"""
+        if not self.conn.alive:
+            raise OSError("server has gone away")
+        self.conn.queries.append(query)
+
+    def fetchall(self) -> list:
+        """Rows of the last query"""
+        return [(1,)]
+
+    def close(self) -> None:
+        """Close the cursor"""
+
+
+class FakeConnection:
+    """Database connection recording what is done with it"""
+
+    def __init__(self):
+        """initialize instance"""
+        self.alive = True
+        self.closed = False
+        self.rollbacks = 0
+        self.queries = []
+
+    def cursor(self) -> FakeCursor:
+        """New cursor"""
+        return FakeCursor(self)
+
+    def rollback(self) -> None:
+        """Roll back, fails once the server is gone"""
+        if not self.alive:
+            raise OSError("server has gone away")
+        self.rollbacks += 1
+
+    def close(self) -> None:
+        """Close the connection"""
+        self.closed = True
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    """ConnectionPool with fake connections"""
+
+    def setUp(self):
+        """Record the connections opened"""
+        self.opened = []
+
+    def connect(self) -> FakeConnection:
+        """connect function of the pools"""
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+    def test_close_returns_connection(self):
+        """close() gives the connection back, rolled back, for reuse"""
+        pool = ConnectionPool(self.connect, size=2)
+        db = pool.checkout()
+        self.assertIsInstance(db, PooledConnection)
+        db.cursor().execute("SELECT 2")
+        db.close()
+        db.close()
+        self.assertEqual(self.opened[0].rollbacks, 1)
+        self.assertFalse(self.opened[0].closed)
+        with self.assertRaises(AttributeError):
+            db.cursor()
+        again = pool.checkout()
+        self.assertIs(again._conn, self.opened[0])
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(pool.opened, 1)
+        again.close()
+
+    def test_checkout_timeout(self):
+        """checkout() waits at most timeout for a free connection"""
+        pool = ConnectionPool(self.connect, size=1, timeout=0.1)
+        db = pool.checkout()
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            pool.checkout()
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+        pool.timeout = 5
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.checkout()))
+        waiter.start()
+        time.sleep(0.05)
+        db.close()
+        waiter.join(5)
+        self.assertEqual(len(got), 1)
+        self.assertIs(got[0]._conn, self.opened[0])
+        self.assertEqual(pool.opened, 1)
+
+    def test_max_lifetime(self):
+        """Connections older than max_lifetime are replaced"""
+        pool = ConnectionPool(self.connect, size=1, max_lifetime=0.05)
+        pool.checkout().close()
+        time.sleep(0.1)
+        db = pool.checkout()
+        self.assertEqual(len(self.opened), 2)
+        self.assertTrue(self.opened[0].closed)
+        self.assertIs(db._conn, self.opened[1])
+        self.assertEqual(pool.opened, 1)
+
+    def test_idle_health_check(self):
+        """Idle connections are checked, dead ones are discarded"""
+        pool = ConnectionPool(self.connect, size=2, check_idle=0)
+        pool.checkout().close()
+        db = pool.checkout()
+        self.assertIs(db._conn, self.opened[0])
+        self.assertEqual(self.opened[0].queries, ["SELECT 1"])
+        db.close()
+
+        self.opened[0].alive = False
+        db = pool.checkout()
+        self.assertTrue(self.opened[0].closed)
+        self.assertIs(db._conn, self.opened[1])
+        self.assertEqual(pool.opened, 1)
+
+    def test_recently_used_not_checked(self):
+        """Connections idle for less than check_idle are not checked"""
+        pool = ConnectionPool(self.connect, size=1, check_idle=30)
+        pool.checkout().close()
+        pool.checkout().close()
+        self.assertEqual(self.opened[0].queries, [])
+
+    def test_failed_rollback_discards(self):
+        """A connection that cannot roll back is not given back"""
+        pool = ConnectionPool(self.connect, size=1)
+        db = pool.checkout()
+        self.opened[0].alive = False
+        db.close()
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(pool.opened, 0)
+
+    def test_connect_failure_frees_slot(self):
+        """A failed connect does not keep its slot"""
+        def connect():
+            raise OSError("connection refused")
+
+        pool = ConnectionPool(connect, size=1, timeout=0.1)
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                pool.checkout()
+        self.assertEqual(pool.opened, 0)
+
+    def test_close_pool(self):
+        """close() closes the idle connections"""
+        pool = ConnectionPool(self.connect, size=2)
+        first, second = pool.checkout(), pool.checkout()
+        first.close()
+        pool.close()
+        self.assertTrue(self.opened[0].closed)
+        self.assertEqual(pool.opened, 1)
+        second.close()
+
+
+class GetDbTest(unittest.TestCase):
+    """get_db with and without a pool"""
+
+    def setUp(self):
+        """Start without a pool"""
+        patcher = mock.patch.object(filtered_logger, 'DB_POOL', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(filtered_logger, 'connect_db',
+                                    side_effect=FakeConnection)
+        self.connect_db = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_without_pool(self):
+        """PERSONAL_DATA_DB_POOL_SIZE unset: a new connection each call"""
+        with mock.patch.dict(os.environ):
+            os.environ.pop('PERSONAL_DATA_DB_POOL_SIZE', None)
+            db = filtered_logger.get_db()
+        self.assertIsInstance(db, FakeConnection)
+        self.assertIsNone(filtered_logger.DB_POOL)
+
+    def test_with_pool(self):
+        """PERSONAL_DATA_DB_POOL_SIZE > 0: connections come from DB_POOL"""
+        with mock.patch.dict(os.environ, {
+                'PERSONAL_DATA_DB_POOL_SIZE': '2',
+                'PERSONAL_DATA_DB_POOL_TIMEOUT': '0.1'}):
+            db = filtered_logger.get_db()
+            self.assertIsInstance(db, PooledConnection)
+            conn = db._conn
+            db.close()
+            db = filtered_logger.get_db()
+            self.assertIs(db._conn, conn)
+            other = filtered_logger.get_db()
+            with self.assertRaises(TimeoutError):
+                filtered_logger.get_db()
+        pool = filtered_logger.DB_POOL
+        self.assertEqual((pool.size, pool.timeout), (2, 0.1))
+        self.assertEqual(self.connect_db.call_count, 2)
+        db.close()
+        other.close()
+
+    def test_invalid_settings(self):
+        """A setting that is not a number is reported by name"""
+        for name, value in (('PERSONAL_DATA_DB_POOL_SIZE', 'five'),
+                            ('PERSONAL_DATA_DB_POOL_SIZE', '2.5'),
+                            ('PERSONAL_DATA_DB_POOL_TIMEOUT', '10s')):
+            settings = {'PERSONAL_DATA_DB_POOL_SIZE': '2', name: value}
+            with mock.patch.dict(os.environ, settings):
+                with self.assertRaisesRegex(ValueError, name):
+                    filtered_logger.get_db()
+            self.assertIsNone(filtered_logger.DB_POOL)
+        self.connect_db.assert_not_called()
+
+
+class SqliteShimTest(unittest.TestCase):
+    """The pool and get_db against real connections: sqlite3 stands in
+    for the MySQL server (same DB-API connection and cursor methods)"""
+
+    def setUp(self):
+        """A database file with a users table, without DB_POOL"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "users.db")
+        self.connections = []
+        with closing(self.connect()) as conn:
+            conn.execute("CREATE TABLE users (name TEXT, email TEXT)")
+            conn.execute("INSERT INTO users VALUES ('bob', 'bob@x.io')")
+            conn.commit()
+        patcher = mock.patch.object(filtered_logger, 'DB_POOL', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(filtered_logger, 'connect_db',
+                                    side_effect=self.connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(os.environ,
+                                  {'PERSONAL_DATA_DB_POOL_SIZE': '2'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connect(self) -> sqlite3.Connection:
+        """Open a connection usable from the threads of the test"""
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.connections.append(conn)
+        return conn
+
+    def tearDown(self):
+        """Close the pool and the connections"""
+        if filtered_logger.DB_POOL is not None:
+            filtered_logger.DB_POOL.close()
+        for conn in self.connections:
+            conn.close()
+
+    def count_users(self, db) -> int:
+        """Number of rows in users"""
+        cursor = db.cursor()
+        cursor.execute("SELECT COUNT(*) FROM users")
+        count = cursor.fetchall()[0][0]
+        cursor.close()
+        return count
+
+    def test_with_statement(self):
+        """with get_db() as db: queries, then gives the connection back"""
+        with filtered_logger.get_db() as db:
+            self.assertIsInstance(db, PooledConnection)
+            self.assertEqual(self.count_users(db), 1)
+            conn = db._conn
+        with self.assertRaises(AttributeError):
+            db.cursor()
+        with filtered_logger.get_db() as db:
+            self.assertIs(db._conn, conn)
+        self.assertEqual(len(self.connections), 2)
+
+    def test_with_statement_error(self):
+        """The connection is given back when the block raises"""
+        with self.assertRaises(sqlite3.OperationalError):
+            with filtered_logger.get_db() as db:
+                db.cursor().execute("SELECT * FROM missing")
+        self.assertEqual(len(filtered_logger.DB_POOL._idle), 1)
+
+    def test_rollback_on_checkin(self):
+        """Uncommitted changes are rolled back when given back"""
+        with filtered_logger.get_db() as db:
+            db.cursor().execute("INSERT INTO users VALUES ('eve', 'e@x.io')")
+            self.assertEqual(self.count_users(db), 2)
+        with filtered_logger.get_db() as db:
+            self.assertEqual(self.count_users(db), 1)
+
+    def test_health_check(self):
+        """An idle connection is checked with SELECT 1, a closed one is
+        replaced"""
+        with filtered_logger.get_db() as db:
+            conn = db._conn
+        pool = filtered_logger.DB_POOL
+        pool.check_idle = 0
+        with filtered_logger.get_db() as db:
+            self.assertIs(db._conn, conn)
+        conn.close()
+        with filtered_logger.get_db() as db:
+            self.assertIsNot(db._conn, conn)
+            self.assertEqual(self.count_users(db), 1)
+        self.assertEqual(pool.opened, 1)
+
+    def test_threads(self):
+        """Concurrent users share at most size connections"""
+        counts = []
+
+        def work():
+            """query through a pooled connection"""
+            for _ in range(20):
+                with filtered_logger.get_db() as db:
+                    counts.append(self.count_users(db))
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counts, [1] * 80)
+        self.assertLessEqual(len(self.connections), 3)
+        self.assertLessEqual(filtered_logger.DB_POOL.opened, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""Tests of encrypt_password"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import bcrypt  # noqa: E402
+import encrypt_password  # noqa: E402
+
+
+class NeedsRehashTest(unittest.TestCase):
+    """needs_rehash against bcrypt_rounds()"""
+
+    def test_only_lower_costs(self):
+        """Only hashes with a lower cost than the target need a rehash"""
+        with mock.patch.object(encrypt_password, 'bcrypt_rounds',
+                               return_value=5):
+            for rounds, expected in ((4, True), (5, False), (6, False)):
+                hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds))
+                self.assertEqual(encrypt_password.needs_rehash(hashed),
+                                 expected)
+            hashed = encrypt_password.hash_password("secret")
+            self.assertFalse(encrypt_password.needs_rehash(hashed))
+            self.assertTrue(encrypt_password.is_valid(hashed, "secret"))
+
+
+if __name__ == "__main__":
+    unittest.main()
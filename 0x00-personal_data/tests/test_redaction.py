@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Tests of the redaction engine against the regex it replaced"""
+
+import os
+import random
+import re
+import sys
+import unittest
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from filtered_logger import filter_datum, redactor  # noqa: E402
+
+
+def regex_filter_datum(fields: List[str],
+                       redaction: str, message: str, separator: str) -> str:
+    """filter_datum before the cached engine: one regex built per call"""
+    pattern = "|".join(fr'(?<={field}=)[^{separator}]*' for field in fields)
+    return re.sub(pattern, redaction, message)
+
+
+def outcome(function, *args):
+    """Result of a call, or the type of the exception it raised"""
+    try:
+        return function(*args)
+    except Exception as error:
+        return type(error)
+
+
+class RedactorTest(unittest.TestCase):
+    """redactor() and filter_datum() give the output of re.sub"""
+
+    def assertSame(self, fields: List[str], redaction: str, message: str,
+                   separator: str) -> None:
+        """Both implementations agree on these arguments"""
+        expected = outcome(regex_filter_datum, fields, redaction, message,
+                           separator)
+        got = outcome(lambda: redactor(tuple(fields), separator)(
+            redaction, message))
+        self.assertEqual(got, expected,
+                         (fields, redaction, message, separator))
+        self.assertEqual(outcome(filter_datum, fields, redaction, message,
+                                 separator), expected)
+
+    def test_documented_example(self):
+        """The example of the project"""
+        message = ("name=egg;email=eggmin@eggsample.com;password=eggcellent;"
+                   "date_of_birth=12/12/1986;")
+        self.assertEqual(
+            filter_datum(["password", "date_of_birth"], "xxx", message, ";"),
+            "name=egg;email=eggmin@eggsample.com;password=xxx;"
+            "date_of_birth=xxx;")
+
+    def test_corner_cases(self):
+        """Empty values, fields at the end, repeated and nested fields"""
+        fields = ["name", "email", "password"]
+        for message in ["", "=", ";", "name=", "name=;", "name=;email=;",
+                        "x;name=", "a=1;name=", "name=name=bob;",
+                        "name==bob;", "username=bob;name=alice",
+                        "email=a;email=b;email=", "name=bob", ";;name=;;",
+                        "password=p=w;", "NAME=bob;name=bob;",
+                        "name=bob;email"]:
+            for separator in [";", ";,", "; ", ",;="]:
+                self.assertSame(fields, "***", message, separator)
+                self.assertSame(fields, "", message, separator)
+        self.assertSame([], "x", "name=bob;", ";")
+        self.assertSame(["name"], "x", "name=bob;", "")
+
+    def test_regex_metacharacters(self):
+        """Fields and separators that are regular expressions fall back
+        on the regex, errors included"""
+        for fields, separator in [(["e.mail"], ";"), (["a+b", "name"], ";"),
+                                  (["(name)"], ";"), (["name"], "^"),
+                                  (["name"], "-"), (["name"], "]"),
+                                  (["name"], "a-z"), (["name"], "\\"),
+                                  (["na[me"], ";"), (["name|x"], ";")]:
+            for message in ["e.mail=a;exmail=b;a+b=c;aab=d;(name)=e;",
+                            "name=bob^x-y]z;name=a\\b;", "name|x=1;x=2;"]:
+                self.assertSame(fields, "***", message, separator)
+
+    def test_redaction_escapes(self):
+        """Redactions with backslashes are processed as re.sub does"""
+        for redaction in ["\\g<0>", "[\\g<0>]", "a\\nb", "\\\\", "\\t",
+                          "\\1", "\\", "\\q"]:
+            self.assertSame(["name", "email"], redaction,
+                            "name=bob;email=b@x.com;name=;", ";")
+
+    def test_random(self):
+        """Random messages built from fields, separators and noise"""
+        rng = random.Random(12)
+        names = ["name", "email", "ssn", "phone", "password", "me", "e",
+                 "pass", "word"]
+        for _ in range(3000):
+            fields = rng.sample(names, rng.randint(1, 5))
+            separator = rng.choice([";", ",", "; ", ";|", "&", " ", "/:"])
+            redaction = rng.choice(["***", "", "x", "[redacted]", "=;"])
+            tokens = names + ["=", "=", ";", ",", " ", "&", "|", ":", "/",
+                              "bob", "a@b.c", "12", ""]
+            message = "".join(rng.choice(tokens)
+                              for _ in range(rng.randint(0, 30)))
+            self.assertSame(fields, redaction, message, separator)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,10 +3,13 @@
 Route module for the API
 """
 from os import getenv
+from api.v1.auth.auth import PathMatcher
 from api.v1.views import app_views
-from flask import Flask, jsonify, abort, request
+from flask import Flask, jsonify, abort, g, request
 from flask_cors import (CORS, cross_origin)
+from models.metrics import AUTH_SECONDS, REQUEST_SECONDS
 import os
+import time
 
 
 app = Flask(__name__)
@@ -24,21 +27,50 @@ else:
     auth = Auth()
 
 
+# public routes, extended by AUTH_EXCLUDED_PATHS (comma-separated)
+excluded_paths = PathMatcher(['/api/v1/status/', '/api/v1/metrics/',
+                              '/api/v1/unauthorized/', '/api/v1/forbidden/'])
+for path in getenv("AUTH_EXCLUDED_PATHS", "").split(","):
+    if path.strip():
+        excluded_paths.add(path.strip())
+
+
 @app.before_request
 def before_request():
     """Gets executed before request is processed"""
+    g.request_start = time.perf_counter()
     if auth is None:
         return
-    excluded_paths = ['/api/v1/status/', '/api/v1/unauthorized/',
-                      '/api/v1/forbidden/']
-    if not auth.require_auth(request.path, excluded_paths):
+    with AUTH_SECONDS.time('require_auth'):
+        required = auth.require_auth(request.path, excluded_paths)
+    if not required:
         return
-    if auth.authorization_header(request) is None:
+    with AUTH_SECONDS.time('credentials'):
+        missing = auth.authorization_header(request) is None
+    if missing:
         abort(401)
-    if auth.current_user(request) is None:
+    with AUTH_SECONDS.time('current_user'):
+        user = auth.current_user(request)
+    if user is None:
         abort(403)
 
 
+@app.after_request
+def after_request(response):
+    """ Reports the backend lookups done to authenticate the request,
+        records its duration
+    """
+    context = g.get('auth_context')
+    if context is not None:
+        response.headers['X-Auth-Lookups'] = str(context.lookups)
+    if 'request_start' in g:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start,
+                                request.method, route,
+                                str(response.status_code))
+    return response
+
+
 @app.errorhandler(404)
 def not_found(error) -> str:
     """ Not found handler
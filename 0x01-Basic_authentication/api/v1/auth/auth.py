@@ -1,39 +1,161 @@
 #!/usr/bin/env python3
 """Auth Module"""
 
-from flask import request
-import re
-from typing import List, TypeVar
+from flask import g, has_request_context
+from flask import request as current_request
+from functools import lru_cache
+from typing import (Callable, Iterable, List, Optional, Tuple,
+                    TypeVar, Union)
+
+
+class PathMatcher:
+    """ Excluded paths compiled once: a set of the exact paths and a
+        character trie of the prefixes of the paths ending with `*`,
+        so matching does not depend on the number of paths
+    """
+    END = ''
+
+    def __init__(self, paths: Iterable[str] = ()):
+        """ Compile paths
+        """
+        self.exact = set()
+        self.prefixes = {}
+        self.size = 0
+        for path in paths:
+            self.add(path)
+
+    def add(self, path: str):
+        """ Add a path, a prefix if it ends with `*`
+        """
+        if path.endswith('*'):
+            node = self.prefixes
+            for char in path[:-1]:
+                node = node.setdefault(char, {})
+            node[self.END] = True
+        else:
+            self.exact.add(path)
+        self.size += 1
+
+    def __len__(self) -> int:
+        """ Number of paths
+        """
+        return self.size
+
+    def match(self, path: str) -> bool:
+        """ Whether a path (with its trailing slash) is excluded
+        """
+        if path in self.exact:
+            return True
+        node = self.prefixes
+        for char in path:
+            if self.END in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return self.END in node
+
+
+@lru_cache(maxsize=32)
+def compile_paths(paths: Tuple[str, ...]) -> PathMatcher:
+    """ PathMatcher of a list of paths, for callers passing lists
+    """
+    return PathMatcher(paths)
+
+
+class AuthContext:
+    """ What the authentication resolved for a request: the header,
+        cookie, session and user are resolved once however many times
+        they are asked for, `lookups` counts the backend lookups
+        (storage, session store) they triggered
+    """
+
+    def __init__(self):
+        """ Empty context
+        """
+        self.values = {}
+        self.lookups = 0
+
+    def get(self, key: str, resolve: Callable):
+        """ Value of key, resolved on first access
+        """
+        if key not in self.values:
+            self.values[key] = resolve()
+        return self.values[key]
+
+    def forget(self, *keys: str):
+        """ Drop values resolved earlier
+        """
+        for key in keys:
+            self.values.pop(key, None)
+
+
+def auth_context(request=None) -> Optional[AuthContext]:
+    """ Context of the request being served (kept on flask.g), None
+        outside of a request or for another request object
+    """
+    if not has_request_context():
+        return None
+    if request is not None and request is not current_request \
+            and request is not current_request._get_current_object():
+        return None
+    if 'auth_context' not in g:
+        g.auth_context = AuthContext()
+    return g.auth_context
+
+
+def count_lookup():
+    """ Count a backend lookup for the request being served
+    """
+    context = auth_context()
+    if context is not None:
+        context.lookups += 1
 
 
 class Auth:
     """ Auth class
     """
-    def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
-        """ defines auth requirement
+    def require_auth(self, path: str,
+                     excluded_paths: Union[List[str], PathMatcher]) -> bool:
+        """ defines auth requirement: excluded_paths is preferably a
+            PathMatcher built once, a list is compiled on first use
         """
         if path is None or excluded_paths is None or len(excluded_paths) == 0:
             return True
 
+        if not isinstance(excluded_paths, PathMatcher):
+            excluded_paths = compile_paths(tuple(excluded_paths))
+
+        # Normalize path
         if path[-1] != '/':
             path += '/'
 
-        for excluded_path in excluded_paths:
-            if excluded_path.endswith('*'):
-                if path.startswith(excluded_path[:-1]):
-                    return False
-            elif path == excluded_path:
-                return False
-        return True
+        return not excluded_paths.match(path)
 
     def authorization_header(self, request=None) -> str:
         """ auth header
         """
-        if request is None or request.headers.get('Authorization') is None:
+        if request is None:
             return None
-        return request.headers.get('Authorization')
+        return self.memoize(request, 'authorization_header',
+                            lambda: request.headers.get('Authorization'))
 
     def current_user(self, request=None) -> TypeVar('User'):
-        """ current authenticated user
+        """ current authenticated user, resolved once per request
+        """
+        return self.memoize(request, 'user',
+                            lambda: self.resolve_user(request))
+
+    def resolve_user(self, request=None) -> TypeVar('User'):
+        """ look the authenticated user up, overridden by subclasses
         """
         return None
+
+    def memoize(self, request, key: str, resolve: Callable):
+        """ resolve() once for the request being served, each time for
+            other request objects
+        """
+        context = auth_context(request)
+        if context is None:
+            return resolve()
+        return context.get(key, resolve)
@@ -1,8 +1,10 @@
 #!/usr/bin/env python3
 """Basic Auth Module"""
 
-from api.v1.auth.auth import Auth
+from api.v1.auth.auth import Auth, count_lookup
+from api.v1.auth.credential_cache import credential_cache
 from base64 import b64decode
+from models.metrics import AUTH_SECONDS
 from models.user import User
 from typing import Tuple, TypeVar
 
@@ -10,6 +12,9 @@ from typing import Tuple, TypeVar
 class BasicAuth(Auth):
     """ Basic Auth Class
     """
+    # verified headers, shared by all the instances
+    credentials = credential_cache()
+
     def extract_base64_authorization_header(self,
                                             authorization_header: str) -> str:
         """ Extract base64 auth header
@@ -60,31 +65,44 @@ class BasicAuth(Auth):
         if user_email is None or not isinstance(user_email, str) \
                 or user_pwd is None or not isinstance(user_pwd, str):
             return None
+        count_lookup()
         users = User.search({"email": user_email})
         if not users:
             return None
 
         user = users[0]
-        if not user.is_valid_password(user_pwd):
+        with AUTH_SECONDS.time('password_check'):
+            valid = user.is_valid_password(user_pwd)
+        if not valid:
             return None
 
         return user
 
-    def current_user(self, request=None) -> TypeVar('User'):
+    def resolve_user(self, request=None) -> TypeVar('User'):
         """ retrieves the User instance for a request
         """
         auth_header = self.authorization_header(request)
-        print(auth_header)
         if auth_header is None:
             return None
-        base64_auth_header = self.extract_base64_authorization_header(
-                auth_header)
-        if base64_auth_header is None:
-            return None
-        base64_auth_header_d = self.decode_base64_authorization_header(
-                base64_auth_header)
-        if base64_auth_header_d is None:
-            return None
-        email, password = self.extract_user_credentials(base64_auth_header_d)
+        # a client sending the same header again skips decoding and
+        # password hashing
+        with AUTH_SECONDS.time('credential_cache'):
+            cache_key = self.credentials.key(auth_header)
+            user = self.credentials.get(cache_key, User)
+        if user is not None:
+            return user
+        with AUTH_SECONDS.time('decode_header'):
+            base64_auth_header = self.extract_base64_authorization_header(
+                    auth_header)
+            if base64_auth_header is None:
+                return None
+            base64_auth_header_d = self.decode_base64_authorization_header(
+                    base64_auth_header)
+            if base64_auth_header_d is None:
+                return None
+            email, password = self.extract_user_credentials(
+                    base64_auth_header_d)
         user = self.user_object_from_credentials(email, password)
+        if user is not None:
+            self.credentials.put(cache_key, user)
         return user
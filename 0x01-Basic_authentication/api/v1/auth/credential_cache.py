@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+""" Credential cache module: Authorization headers already verified
+"""
+from api.v1.auth.auth import count_lookup
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional, TypeVar
+import hashlib
+import hmac
+import os
+import time
+
+
+class CredentialCache():
+    """ Bounded LRU cache with TTL: HMAC of an Authorization header ->
+        the user it was verified for. Headers are never stored: the key
+        is random per process.
+    """
+
+    def __init__(self, size: int = 1024, ttl: int = 300):
+        """ Initialize a cache of size entries living ttl seconds
+        """
+        self.size = size
+        self.ttl = ttl
+        self._secret = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def key(self, authorization_header: str) -> bytes:
+        """ Cache key of a header
+        """
+        return hmac.new(self._secret, authorization_header.encode('utf-8'),
+                        hashlib.sha256).digest()
+
+    def get(self, key: bytes, user_cls: type) -> Optional[TypeVar('User')]:
+        """ User verified for the key, None if unknown, expired, or if
+            the user was saved or removed since
+        """
+        if self.size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_id, updated_at, password, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        count_lookup()
+        user = user_cls.get(user_id)
+        # save() refreshes updated_at, another process may have changed
+        # the password within the same second
+        if user is None or user.updated_at != updated_at \
+                or user.password != password:
+            self.invalidate(key)
+            return None
+        return user
+
+    def put(self, key: bytes, user: TypeVar('User')):
+        """ Remember the user verified for the key
+        """
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (user.id, user.updated_at, user.password,
+                                  time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: bytes):
+        """ Forget a key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+def credential_cache() -> CredentialCache:
+    """ Cache configured by BASIC_AUTH_CACHE_SIZE (0 disables it) and
+        BASIC_AUTH_CACHE_TTL (seconds)
+    """
+    try:
+        size = int(os.getenv('BASIC_AUTH_CACHE_SIZE', 1024))
+    except ValueError:
+        size = 1024
+    try:
+        ttl = int(os.getenv('BASIC_AUTH_CACHE_TTL', 300))
+    except ValueError:
+        ttl = 300
+    return CredentialCache(size, ttl)
@@ -4,17 +4,21 @@
 from datetime import datetime
 from typing import TypeVar, List, Iterable
 from os import path
+from models.metrics import timed
 import json
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+INDEXED_VALUES = {}
 
 
 class Base():
     """ Base class
     """
+    indexed_attributes = ()
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
@@ -22,6 +26,8 @@ class Base():
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
+        if INDEXES.get(s_class) is None:
+            self.__class__.reset_indexes()
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
@@ -35,6 +41,15 @@ class Base():
         else:
             self.updated_at = datetime.utcnow()
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute: a stored object changing an indexed
+            attribute is re-indexed at once, so search() sees the live
+            values and not only the saved ones
+        """
+        super().__setattr__(name, value)
+        if name in self.__class__.indexed_attributes:
+            self.__class__._reindex(self, name, value)
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -58,21 +73,26 @@ class Base():
         return result
 
     @classmethod
+    @timed('load')
     def load_from_file(cls):
         """ Load all objects from file
         """
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
         DATA[s_class] = {}
+        cls.reset_indexes()
         if not path.exists(file_path):
             return
 
         with open(file_path, 'r') as f:
             objs_json = json.load(f)
             for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+                obj = cls(**obj_json)
+                DATA[s_class][obj_id] = obj
+                cls._index(obj)
 
     @classmethod
+    @timed('save_to_file')
     def save_to_file(cls):
         """ Save all objects to file
         """
@@ -85,23 +105,101 @@ class Base():
         with open(file_path, 'w') as f:
             json.dump(objs_json, f)
 
+    @timed('save')
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
         DATA[s_class][self.id] = self
+        self.__class__._index(self)
         self.__class__.save_to_file()
 
+    @timed('remove')
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
         if DATA[s_class].get(self.id) is not None:
             del DATA[s_class][self.id]
+            self.__class__._unindex(self.id)
             self.__class__.save_to_file()
 
     @classmethod
+    def reset_indexes(cls):
+        """ Create empty indexes for all indexed attributes
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {attr: {} for attr in cls.indexed_attributes}
+        INDEXED_VALUES[s_class] = {}
+
+    @classmethod
+    def _index(cls, obj: TypeVar('Base')):
+        """ Add (or refresh) an object in the indexes
+        """
+        s_class = cls.__name__
+        cls._unindex(obj.id)
+        values = {}
+        for attr, index in INDEXES[s_class].items():
+            value = getattr(obj, attr, None)
+            index.setdefault(value, {})[obj.id] = None
+            values[attr] = value
+        INDEXED_VALUES[s_class][obj.id] = values
+
+    @classmethod
+    def _reindex(cls, obj: TypeVar('Base'), name: str, value):
+        """ Refresh the indexes of a stored object whose indexed
+            attribute name was set to value
+        """
+        values = INDEXED_VALUES.get(cls.__name__, {}).get(
+            getattr(obj, 'id', None))
+        if values is None or values.get(name) == value:
+            # not stored yet (or a copy being built), or unchanged
+            return
+        if DATA[cls.__name__].get(obj.id) is not obj:
+            return
+        cls._index(obj)
+
+    @classmethod
+    def _unindex(cls, obj_id: str):
+        """ Remove an object from the indexes
+        """
+        s_class = cls.__name__
+        values = INDEXED_VALUES[s_class].pop(obj_id, None)
+        if values is None:
+            return
+        for attr, value in values.items():
+            bucket = INDEXES[s_class][attr].get(value)
+            if bucket is None:
+                continue
+            bucket.pop(obj_id, None)
+            if len(bucket) == 0:
+                del INDEXES[s_class][attr][value]
+
+    @classmethod
+    def _indexed_candidates(cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Objects possibly matching attributes, from the smallest index
+            bucket - None if no indexed attribute can be used
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.get(s_class, {})
+        best = None
+        for k, v in attributes.items():
+            if k not in indexes:
+                continue
+            try:
+                bucket = indexes[k].get(v, {})
+            except TypeError:
+                continue
+            if best is None or len(bucket) < len(best):
+                best = bucket
+        if best is None:
+            return None
+        objs = DATA[s_class]
+        return [objs[obj_id] for obj_id in list(best) if obj_id in objs]
+
+    @classmethod
+    @timed('count')
     def count(cls) -> int:
         """ Count all objects
         """
@@ -109,12 +207,14 @@ class Base():
         return len(DATA[s_class].keys())
 
     @classmethod
+    @timed('all')
     def all(cls) -> Iterable[TypeVar('Base')]:
         """ Return all objects
         """
         return cls.search()
 
     @classmethod
+    @timed('get')
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
@@ -122,10 +222,14 @@ class Base():
         return DATA[s_class].get(id)
 
     @classmethod
+    @timed('search')
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+            (equality on indexed attributes uses the indexes, kept up to
+            date as attributes are set)
         """
         s_class = cls.__name__
+
         def _search(obj):
             if len(attributes) == 0:
                 return True
@@ -133,5 +237,8 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        objs = cls._indexed_candidates(attributes)
+        if objs is None:
+            objs = DATA[s_class].values()
+        return list(filter(_search, objs))
@@ -2,15 +2,18 @@
 """ Session Auth
 """
 
-from api.v1.auth.auth import Auth
+from api.v1.auth.auth import Auth, auth_context, count_lookup
+from api.v1.auth.session_store import session_store
 import uuid
+from models.metrics import AUTH_SECONDS
 from models.user import User
 
 
 class SessionAuth(Auth):
     """ Session Auth Class
     """
-    user_id_by_session_id = {}
+    # shared by all the instances, see SESSION_STORE
+    user_id_by_session_id = session_store()
 
     def create_session(self, user_id: str = None) -> str:
         """ creates a session
@@ -18,30 +21,62 @@ class SessionAuth(Auth):
         if user_id is None or not isinstance(user_id, str):
             return None
         session_id = str(uuid.uuid4())
-        self.user_id_by_session_id[session_id] = user_id
+        self.user_id_by_session_id.set(session_id,
+                                       self.session_info(user_id),
+                                       self.session_ttl())
 
         return session_id
 
+    def session_info(self, user_id: str):
+        """ what is stored for a new session
+        """
+        return user_id
+
+    def session_ttl(self) -> int:
+        """ lifetime of a new session in the store, None for no limit
+        """
+        return None
+
     def user_id_for_session_id(self, session_id: str = None) -> str:
         """ get user_id for session
         """
         if session_id is None or not isinstance(session_id, str):
             return None
+        count_lookup()
         return self.user_id_by_session_id.get(session_id)
 
-    def current_user(self, request=None):
-        """ retrieve current user
+    def session_user_id(self, request=None) -> str:
+        """ user_id of the session of a request, once per request
         """
         session_id = self.session_cookie(request)
         if session_id is None:
             return None
+        return self.memoize(request, 'session_user_id',
+                            lambda: self.timed_session_lookup(session_id))
 
-        user_id = self.user_id_for_session_id(session_id)
+    def timed_session_lookup(self, session_id: str) -> str:
+        """ user_id_for_session_id, timed as an authentication phase
+        """
+        with AUTH_SECONDS.time('session_lookup'):
+            return self.user_id_for_session_id(session_id)
+
+    def resolve_user(self, request=None):
+        """ retrieve current user
+        """
+        user_id = self.session_user_id(request)
         if user_id is None:
             return None
 
+        count_lookup()
         return User.get(user_id)
 
+    def forget_session(self, request=None):
+        """ drop the session resolved for a request once destroyed
+        """
+        context = auth_context(request)
+        if context is not None:
+            context.forget('session_user_id', 'user')
+
     def destroy_session(self, request=None):
         """ destroy the session / logout
         """
@@ -52,9 +87,11 @@ class SessionAuth(Auth):
         if session_id is None:
             return False
 
-        user_id = self.user_id_for_session_id(session_id)
+        user_id = self.session_user_id(request)
         if user_id is None:
             return False
 
-        del self.user_id_by_session_id[session_id]
+        # already gone if another logout of the session won the race
+        self.user_id_by_session_id.delete(session_id)
+        self.forget_session(request)
         return True
@@ -1,21 +1,31 @@
 #!/usr/bin/env python3
 """ SessionDBAuth module
 """
+from api.v1.auth.auth import count_lookup
 from api.v1.auth.session_exp_auth import SessionExpAuth
 from models.user_session import UserSession
 from datetime import datetime, timedelta
+from threading import Lock
+from typing import List
+import heapq
 
 
 class SessionDBAuth(SessionExpAuth):
     """ Session DB Auth Class
     """
+    # (expiration, session_id) min-heap of the UserSession records to
+    # reap, the ones saved before this process started are scheduled once
+    expiry_heap = []
+    expiry_lock = Lock()
+    expiry_loaded = False
+
     def create_session(self, user_id=None):
         """ Create a session and store it in the database
         """
         session_id = super().create_session(user_id)
         if session_id is None:
             return None
-        
+
         session_info = {
             'user_id': user_id,
             'session_id': session_id
@@ -23,19 +33,71 @@ class SessionDBAuth(SessionExpAuth):
 
         user_session = UserSession(**session_info)
         user_session.save()
+        self.schedule_expiry(session_id, user_session.created_at)
 
         return session_id
 
+    def expires_at(self, created_at: datetime) -> datetime:
+        """ Expiration of a session created at created_at (UTC, as all
+            the datetimes of the models)
+        """
+        return created_at + timedelta(seconds=self.session_duration)
+
+    def schedule_expiry(self, session_id: str, created_at: datetime):
+        """ Register a UserSession in the TTL heap
+        """
+        if self.session_duration <= 0:
+            return
+        with self.expiry_lock:
+            heapq.heappush(self.expiry_heap,
+                           (self.expires_at(created_at), session_id))
+
+    def reap_expired_sessions(self) -> int:
+        """ Evict a batch of expired sessions, from the session store
+            and from the database
+        """
+        count = super().reap_expired_sessions()
+        if self.session_duration <= 0:
+            return count
+        if not SessionDBAuth.expiry_loaded:
+            SessionDBAuth.expiry_loaded = True
+            for user_session in UserSession.all():
+                self.schedule_expiry(user_session.session_id,
+                                     user_session.created_at)
+        now = datetime.utcnow()
+        session_ids = []
+        with self.expiry_lock:
+            while self.expiry_heap and self.expiry_heap[0][0] < now \
+                    and len(session_ids) < self.reap_batch:
+                session_ids.append(heapq.heappop(self.expiry_heap)[1])
+        if session_ids:
+            count += self.evict_sessions(session_ids)
+        return count
+
+    def evict_sessions(self, session_ids: List[str]) -> int:
+        """ Remove the expired sessions from the database in one write
+        """
+        now = datetime.utcnow()
+        expired = []
+        for session_id in session_ids:
+            for user_session in UserSession.search({'session_id':
+                                                    session_id}):
+                if self.expires_at(user_session.created_at) < now:
+                    expired.append(user_session.id)
+        return UserSession.remove_many(expired)
+
     def user_id_for_session_id(self, session_id=None):
         """ Get user_id from session_id by querying the database
         """
         if session_id is None:
             return None
 
+        self.reap_expired_sessions()
+        count_lookup()
         user_sessions = UserSession.search({'session_id': session_id})
         if not user_sessions:
             return None
-        
+
         user_session = user_sessions[0]
         if self.session_duration <= 0:
             return user_session.user_id
@@ -44,7 +106,8 @@ class SessionDBAuth(SessionExpAuth):
         if created_at is None:
             return None
 
-        if created_at + timedelta(seconds=self.session_duration) < datetime.now():
+        if self.expires_at(created_at) < datetime.utcnow():
+            user_session.remove()
             return None
 
         return user_session.user_id
@@ -59,10 +122,14 @@ class SessionDBAuth(SessionExpAuth):
         if session_id is None:
             return False
 
+        count_lookup()
         user_sessions = UserSession.search({'session_id': session_id})
         if not user_sessions:
             return False
 
         user_session = user_sessions[0]
         user_session.remove()
+        # the entry written by SessionExpAuth.create_session
+        self.user_id_by_session_id.pop(session_id, None)
+        self.forget_session(request)
         return True
@@ -2,9 +2,10 @@
 """ Session Expiration Auth
 """
 
+from api.v1.auth.auth import count_lookup
 from api.v1.auth.session_auth import SessionAuth
-from datetime import datetime, timedelta
 import os
+import time
 
 
 class SessionExpAuth(SessionAuth):
@@ -18,6 +19,31 @@ class SessionExpAuth(SessionAuth):
             self.session_duration = int(os.getenv('SESSION_DURATION', 0))
         except ValueError:
             self.session_duration = 0
+        try:
+            self.reap_batch = int(os.getenv('SESSION_REAP_BATCH', 100))
+        except ValueError:
+            self.reap_batch = 100
+
+    def session_info(self, user_id: str) -> dict:
+        """ Session info with its creation time (epoch seconds: the
+            stores keep JSON)
+        """
+        return {
+            "user_id": user_id,
+            "created_at": time.time()
+        }
+
+    def session_ttl(self) -> int:
+        """ Sessions expire from the store after session_duration
+        """
+        return self.session_duration if self.session_duration > 0 else None
+
+    def reap_expired_sessions(self) -> int:
+        """ Evict a batch of expired sessions, returns their number
+        """
+        if self.session_duration <= 0:
+            return 0
+        return self.user_id_by_session_id.reap(self.reap_batch)
 
     def create_session(self, user_id=None):
         """ Create a session with expiration
@@ -26,12 +52,8 @@ class SessionExpAuth(SessionAuth):
         if session_id is None:
             return None
 
-        session_info = {
-            "user_id": user_id,
-            "created_at": datetime.now()
-        }
-
-        self.user_id_by_session_id[session_id] = session_info
+        # each login pays for evicting a batch of expired sessions
+        self.reap_expired_sessions()
         return session_id
 
     def user_id_for_session_id(self, session_id=None):
@@ -40,6 +62,8 @@ class SessionExpAuth(SessionAuth):
         if session_id is None:
             return None
 
+        self.reap_expired_sessions()
+        count_lookup()
         session_info = self.user_id_by_session_id.get(session_id)
         if session_info is None:
             return None
@@ -51,8 +75,8 @@ class SessionExpAuth(SessionAuth):
         if created_at is None:
             return None
 
-        if created_at + timedelta(seconds=self.session_duration) \
-                < datetime.now():
+        if created_at + self.session_duration < time.time():
+            self.user_id_by_session_id.pop(session_id, None)
             return None
 
         return session_info.get("user_id")
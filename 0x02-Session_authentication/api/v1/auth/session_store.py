@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+""" Session stores: where SessionAuth keeps session_id -> session info
+
+The store is selected by SESSION_STORE:
+  - memory (default): a dict of the process
+  - sqlite: a SQLite file (SESSION_STORE_PATH) shared by the workers of
+    a host
+  - redis: a Redis-compatible server (SESSION_STORE_URL) shared by all
+    the nodes
+Session infos must be JSON-serializable.
+"""
+from queue import Empty, LifoQueue
+from threading import Lock, local
+from typing import Any, Iterable, List
+from urllib.parse import urlparse
+import heapq
+import json
+import os
+import select
+import socket
+import sqlite3
+import time
+
+
+class SessionStore():
+    """ Session store interface, with dict-like helpers
+    """
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        """ Session info of a live session or default
+        """
+        raise NotImplementedError()
+
+    def set(self, session_id: str, info: Any, ttl: int = None):
+        """ Store a session info, forgotten after ttl seconds if any
+        """
+        raise NotImplementedError()
+
+    def delete(self, session_id: str) -> bool:
+        """ Forget a session, True if it existed
+        """
+        raise NotImplementedError()
+
+    def reap(self, limit: int) -> int:
+        """ Evict up to limit expired sessions, returns their number
+        """
+        return 0
+
+    def __getitem__(self, session_id: str) -> Any:
+        """ Session info, KeyError if missing
+        """
+        info = self.get(session_id)
+        if info is None:
+            raise KeyError(session_id)
+        return info
+
+    def __setitem__(self, session_id: str, info: Any):
+        """ Store a session info without expiration
+        """
+        self.set(session_id, info)
+
+    def __delitem__(self, session_id: str):
+        """ Forget a session, KeyError if missing
+        """
+        if not self.delete(session_id):
+            raise KeyError(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        """ True if the session is live
+        """
+        return self.get(session_id) is not None
+
+    def pop(self, session_id: str, default: Any = None) -> Any:
+        """ Forget a session, returns its info or default
+        """
+        info = self.get(session_id)
+        if info is None or not self.delete(session_id):
+            return default
+        return info
+
+
+class MemoryStore(SessionStore):
+    """ Sessions of the process, expired ones are kept in a TTL heap
+    """
+
+    def __init__(self):
+        """ Initialize an empty store
+        """
+        self._lock = Lock()
+        # session_id -> (info, expiration or None)
+        self._sessions = {}
+        # (expiration, session_id) min-heap
+        self._expiry_heap = []
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        """ Session info of a live session or default
+        """
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return default
+        info, expires_at = entry
+        if expires_at is not None and expires_at < time.time():
+            return default
+        return info
+
+    def set(self, session_id: str, info: Any, ttl: int = None):
+        """ Store a session info, forgotten after ttl seconds if any
+        """
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._sessions[session_id] = (info, expires_at)
+            if expires_at is not None:
+                heapq.heappush(self._expiry_heap, (expires_at, session_id))
+
+    def delete(self, session_id: str) -> bool:
+        """ Forget a session, True if it existed
+        """
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def reap(self, limit: int) -> int:
+        """ Evict up to limit expired sessions, oldest first
+        """
+        now = time.time()
+        count = 0
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < now \
+                    and count < limit:
+                expires_at, session_id = heapq.heappop(self._expiry_heap)
+                entry = self._sessions.get(session_id)
+                # skip sessions deleted or set again since
+                if entry is not None and entry[1] == expires_at:
+                    del self._sessions[session_id]
+                    count += 1
+        return count
+
+    def __len__(self) -> int:
+        """ Number of stored sessions, expired ones included
+        """
+        return len(self._sessions)
+
+
+class SQLiteStore(SessionStore):
+    """ Sessions in a SQLite file, shared by the processes of a host
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a store in file_path, connections are opened on
+            first use by each thread
+        """
+        self.file_path = file_path
+        self._local = local()
+
+    def _connection(self) -> sqlite3.Connection:
+        """ Connection of the current thread (and process)
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.file_path, timeout=5,
+                               isolation_level=None)
+        # readers do not block the writer of another worker
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                     "session_id TEXT PRIMARY KEY, info TEXT NOT NULL, "
+                     "expires_at REAL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at "
+                     "ON sessions (expires_at)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        """ Session info of a live session or default
+        """
+        row = self._connection().execute(
+            "SELECT info FROM sessions WHERE session_id = ? "
+            "AND (expires_at IS NULL OR expires_at >= ?)",
+            (session_id, time.time())).fetchone()
+        if row is None:
+            return default
+        return json.loads(row[0])
+
+    def set(self, session_id: str, info: Any, ttl: int = None):
+        """ Store a session info, forgotten after ttl seconds if any
+        """
+        expires_at = time.time() + ttl if ttl else None
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+            (session_id, json.dumps(info), expires_at))
+
+    def delete(self, session_id: str) -> bool:
+        """ Forget a session, True if it existed
+        """
+        cursor = self._connection().execute(
+            "DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return cursor.rowcount > 0
+
+    def reap(self, limit: int) -> int:
+        """ Evict up to limit expired sessions, oldest first
+        """
+        cursor = self._connection().execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            "SELECT session_id FROM sessions WHERE expires_at < ? "
+            "ORDER BY expires_at LIMIT ?)", (time.time(), limit))
+        return cursor.rowcount
+
+
+class RedisError(Exception):
+    """ Error reply of a Redis-compatible server
+    """
+
+
+class RedisConnection():
+    """ Connection speaking the Redis protocol (RESP)
+    """
+
+    def __init__(self, host: str, port: int, timeout: float):
+        """ Connect to host:port
+        """
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+        self.pid = os.getpid()
+
+    @staticmethod
+    def encode(command: Iterable) -> bytes:
+        """ RESP array of bulk strings of a command
+        """
+        args = [str(arg).encode('utf-8') if not isinstance(arg, bytes)
+                else arg for arg in command]
+        chunks = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            chunks.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        return b"".join(chunks)
+
+    def read_reply(self) -> Any:
+        """ Parse one reply, error replies are returned as RedisError
+        """
+        line = self.reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed by the server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b"+":
+            return payload.decode('utf-8')
+        if kind == b"-":
+            return RedisError(payload.decode('utf-8'))
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self.reader.read(length + 2)
+            return data[:-2].decode('utf-8')
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self.read_reply() for _ in range(length)]
+        raise ConnectionError("invalid reply {!r}".format(line))
+
+    def send(self, commands: List[Iterable]):
+        """ Send all the commands at once
+        """
+        self.sock.sendall(b"".join(self.encode(c) for c in commands))
+
+    def pipeline(self, commands: List[Iterable]) -> List[Any]:
+        """ Send all the commands at once, then read their replies
+        """
+        self.send(commands)
+        return [self.read_reply() for _ in commands]
+
+    def stale(self) -> bool:
+        """ True if the server closed (or wrote to) the idle connection
+        """
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def close(self):
+        """ Close the connection
+        """
+        self.reader.close()
+        self.sock.close()
+
+
+class RedisStore(SessionStore):
+    """ Sessions in a Redis-compatible server, through a pool of
+        connections
+    """
+
+    def __init__(self, url: str, pool_size: int = 8, timeout: float = 5,
+                 prefix: str = "session:"):
+        """ Initialize a store for redis://[:password@]host[:port][/db]
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.pool_size = pool_size
+        self._pool = LifoQueue(pool_size)
+        self._opened = 0
+        self._lock = Lock()
+
+    def _checkout(self) -> RedisConnection:
+        """ Idle connection of the pool, or a new one while the pool is
+            not full, else wait for one
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except Empty:
+            with self._lock:
+                opening = self._opened < self.pool_size
+                if opening:
+                    self._opened += 1
+            if not opening:
+                try:
+                    conn = self._pool.get(timeout=self.timeout)
+                except Empty:
+                    raise TimeoutError("no free session store connection")
+            else:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+        if conn.pid != os.getpid() or conn.stale():
+            # inherited from the parent of a forked worker, or closed by
+            # the server while idle in the pool
+            if conn.pid == os.getpid():
+                conn.close()
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        return conn
+
+    def _connect(self) -> RedisConnection:
+        """ Open and set up a connection
+        """
+        conn = RedisConnection(self.host, self.port, self.timeout)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            for reply in conn.pipeline(setup):
+                if isinstance(reply, RedisError):
+                    conn.close()
+                    raise reply
+        return conn
+
+    def pipeline(self, commands: List[Iterable]) -> List[Any]:
+        """ Run commands in one round trip on a pooled connection,
+            error replies are returned as RedisError
+        """
+        conn = self._checkout()
+        try:
+            try:
+                conn.send(commands)
+            except ConnectionError:
+                # refused before any reply was read: send them again on a
+                # new connection (never once the server may have run them)
+                conn.close()
+                conn = self._connect()
+                conn.send(commands)
+            replies = [conn.read_reply() for _ in commands]
+        except Exception:
+            # broken connection: do not give it back
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            raise
+        self._pool.put(conn)
+        return replies
+
+    def execute(self, *command: Any) -> Any:
+        """ Run one command
+        """
+        reply = self.pipeline([command])[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        """ Session info of a live session or default
+        """
+        value = self.execute("GET", self.prefix + session_id)
+        if value is None:
+            return default
+        return json.loads(value)
+
+    def set(self, session_id: str, info: Any, ttl: int = None):
+        """ Store a session info, expired by the server after ttl
+            seconds if any
+        """
+        command = ["SET", self.prefix + session_id, json.dumps(info)]
+        if ttl:
+            command += ["EX", ttl]
+        self.execute(*command)
+
+    def set_many(self, infos: dict, ttl: int = None):
+        """ Store several session infos in one round trip
+        """
+        commands = []
+        for session_id, info in infos.items():
+            command = ["SET", self.prefix + session_id, json.dumps(info)]
+            if ttl:
+                command += ["EX", ttl]
+            commands.append(command)
+        for reply in self.pipeline(commands):
+            if isinstance(reply, RedisError):
+                raise reply
+
+    def delete(self, session_id: str) -> bool:
+        """ Forget a session, True if it existed
+        """
+        return self.execute("DEL", self.prefix + session_id) > 0
+
+
+def session_store() -> SessionStore:
+    """ Session store configured by SESSION_STORE
+    """
+    kind = os.getenv('SESSION_STORE', 'memory')
+    if kind == 'sqlite':
+        return SQLiteStore(os.getenv('SESSION_STORE_PATH',
+                                     '.db_sessions.sqlite'))
+    if kind == 'redis':
+        try:
+            pool_size = int(os.getenv('SESSION_STORE_POOL_SIZE', 8))
+        except ValueError:
+            pool_size = 8
+        return RedisStore(os.getenv('SESSION_STORE_URL',
+                                    'redis://localhost:6379/0'), pool_size)
+    return MemoryStore()
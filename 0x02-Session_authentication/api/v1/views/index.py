@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """ Module of Index views
 """
-from flask import jsonify, abort
+from flask import Response, jsonify, abort
 from api.v1.views import app_views
 
 
@@ -26,6 +26,16 @@ def stats() -> str:
     return jsonify(stats)
 
 
+@app_views.route('/metrics', methods=['GET'], strict_slashes=False)
+def metrics() -> str:
+    """ GET /api/v1/metrics
+    Return:
+      - the latency histograms of the process (Prometheus text format)
+    """
+    from models.metrics import render
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
 @app_views.route('/unauthorized', strict_slashes=False)
 def unauthorized():
     """ Unauthorized
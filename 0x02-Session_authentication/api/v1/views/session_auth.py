@@ -4,12 +4,19 @@
 
 from api.v1.views import app_views
 from api.v1.auth.session_auth import SessionAuth
-from flask import jsonify, request, abort
+from flask import current_app, jsonify, request, abort
 from models.user import User
 import os
 
 
-auth = SessionAuth()
+def session_auth() -> SessionAuth:
+    """ the auth of the app (its session class and request context),
+        a plain SessionAuth when the app does not use sessions
+    """
+    auth = current_app.extensions.get('auth')
+    if isinstance(auth, SessionAuth):
+        return auth
+    return SessionAuth()
 
 
 @app_views.route('/auth_session/login', methods=['POST'],
@@ -34,7 +41,7 @@ def login():
     if not user.is_valid_password(password):
         return jsonify({"error": "wrong password"}), 401
 
-    session_id = auth.create_session(user.id)
+    session_id = session_auth().create_session(user.id)
     response = jsonify(user.to_json())
     cookie_name = os.getenv('SESSION_NAME')
     response.set_cookie(cookie_name, session_id)
@@ -47,7 +54,7 @@ def login():
 def logout():
     """ Handle user logout
     """
-    if not auth.destroy_session(request):
+    if not session_auth().destroy_session(request):
         abort(404)
 
     return jsonify({}), 200
@@ -3,18 +3,179 @@
 """
 
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from base64 import b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from flask import Response, abort, jsonify, request
+from itertools import islice
 from models.user import User
+from operator import attrgetter
+from typing import Iterator, Tuple
+import json
+
+
+PAGE_MAX = 1000
+STREAM_BATCH = 500
+# attributes clients can filter on, all indexed by User
+FILTERS = ('email', 'first_name', 'last_name')
+
+
+def encode_cursor(key: str) -> str:
+    """ Opaque cursor of the page after key
+    """
+    return urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> str:
+    """ key of a cursor, None if invalid
+    """
+    try:
+        key = b64decode(cursor.encode('ascii'), altchars=b"-_",
+                        validate=True).decode('utf-8')
+    except (DecodeError, UnicodeError, ValueError):
+        return None
+    return key or None
+
+
+def decode_email_cursor(cursor: str) -> Tuple[str, str]:
+    """ (email, id) of a cursor of a search by email prefix, None if
+        invalid
+    """
+    key = decode_cursor(cursor)
+    if key is None:
+        return None
+    try:
+        email, user_id = json.loads(key)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(email, str) or not isinstance(user_id, str):
+        return None
+    return email, user_id
+
+
+def iter_users(after: str = None) -> Iterator[User]:
+    """ All the users by id, read from the storage by batches
+    """
+    while True:
+        users = User.page(after, STREAM_BATCH)
+        if not users:
+            return
+        yield from users
+        after = users[-1].id
+
+
+def iter_matching(filters: dict, after: str = None) -> Iterator[User]:
+    """ Users whose attributes equal filters, by id
+    """
+    users = [user for user in User.search(filters)
+             if after is None or user.id > after]
+    return iter(sorted(users, key=attrgetter('id')))
+
+
+def iter_email_prefix(prefix: str, filters: dict,
+                      after: Tuple[str, str] = None) -> Iterator[User]:
+    """ Users whose email starts with prefix and whose attributes equal
+        filters, by email
+    """
+    if filters:
+        # the equality filters have hashed indexes
+        users = [user for user in User.search(filters)
+                 if isinstance(user.email, str)
+                 and user.email.startswith(prefix)
+                 and (after is None or (user.email, user.id) > after)]
+        yield from sorted(users, key=attrgetter('email', 'id'))
+        return
+    while True:
+        users = User.search_prefix('email', prefix, after, STREAM_BATCH)
+        if not users:
+            return
+        yield from users
+        after = (users[-1].email, users[-1].id)
+
+
+def json_array(users: Iterator[User]) -> Iterator[str]:
+    """ Chunks of a JSON array of users
+    """
+    yield "["
+    separator = ""
+    for user in users:
+        yield separator + json.dumps(user.to_json())
+        separator = ","
+    yield "]\n"
+
+
+def json_lines(users: Iterator[User]) -> Iterator[str]:
+    """ Lines of NDJSON, one user per line
+    """
+    for user in users:
+        yield json.dumps(user.to_json()) + "\n"
 
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - email, first_name, last_name: only the users with these values
+      - email_prefix: only the users whose email starts with it
+      - limit: number of users of a page (at most 1000)
+      - cursor: next_cursor of the previous page
+      - format: `ndjson` for one user per line
     Return:
-      - list of all User objects JSON represented
+      - list of the User objects JSON represented, streamed, ordered by
+        email with email_prefix, by id otherwise
+      - with limit or cursor, a page of these users:
+        {"users": [...], "next_cursor": <cursor or null>}
+        (with format=ndjson, the next cursor is in X-Next-Cursor)
+      - 400 if limit or cursor is invalid
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    ndjson = request.args.get('format') == 'ndjson'
+    mimetype = "application/x-ndjson" if ndjson else "application/json"
+    filters = {attr: request.args[attr] for attr in FILTERS
+               if attr in request.args}
+    prefix = request.args.get('email_prefix')
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    paginated = limit is not None or cursor is not None
+    if paginated:
+        try:
+            limit = int(limit) if limit is not None else 100
+        except ValueError:
+            limit = 0
+        if limit < 1 or limit > PAGE_MAX:
+            return jsonify({'error': "limit must be between 1 and {}"
+                            .format(PAGE_MAX)}), 400
+    after = None
+    if cursor is not None:
+        after = decode_email_cursor(cursor) if prefix is not None \
+            else decode_cursor(cursor)
+        if after is None:
+            return jsonify({'error': "invalid cursor"}), 400
+
+    if prefix is not None:
+        users = iter_email_prefix(prefix, filters, after)
+    elif filters:
+        users = iter_matching(filters, after)
+    else:
+        users = iter_users(after)
+    if not paginated:
+        # lazily from the storage: memory does not grow with the users
+        chunks = json_lines(users) if ndjson else json_array(users)
+        return Response(chunks, mimetype=mimetype)
+
+    users = list(islice(users, limit + 1))
+    next_cursor = None
+    if len(users) > limit:
+        last = users[limit - 1]
+        next_cursor = encode_cursor(
+            json.dumps([last.email, last.id]) if prefix is not None
+            else last.id)
+    users = users[:limit]
+    if ndjson:
+        response = Response(json_lines(users), mimetype=mimetype)
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    return jsonify({"users": [user.to_json() for user in users],
+                    "next_cursor": next_cursor})
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+""" Memory benchmark of the model records, regular vs COMPACT_MODELS=1
+
+Usage: ./bench_memory.py [number of records]
+"""
+import os
+import subprocess
+import sys
+
+
+def measure(count: int):
+    """ Build `count` UserSession and User records, serialized once
+        like save_to_file() does, print bytes used
+    """
+    import tracemalloc
+    tracemalloc.start()
+    from models.base import DATA
+    from models.user import User
+    from models.user_session import UserSession
+
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        user_session = UserSession(user_id=str(i), session_id=str(i))
+        DATA['UserSession'][user_session.id] = user_session
+        user_session.to_json(True)
+    sessions = tracemalloc.get_traced_memory()[0] - before
+
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(count):
+        user = User(email="user{}@example.com".format(i),
+                    first_name="First", last_name="Last")
+        DATA['User'][user.id] = user
+        user.to_json(True)
+    users = tracemalloc.get_traced_memory()[0] - before
+    print(sessions, users)
+
+
+def main():
+    """ Run the measure in one process per mode
+    """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for compact in ('0', '1'):
+        env = dict(os.environ, COMPACT_MODELS=compact, PYTHONPATH=here)
+        out = subprocess.run([sys.executable, __file__, "--measure",
+                              str(count)], env=env, cwd=here, check=True,
+                             capture_output=True, text=True).stdout
+        results[compact] = [int(v) for v in out.split()]
+
+    print("{} records per class".format(count))
+    for i, name in enumerate(("UserSession", "User")):
+        regular, compact = results['0'][i], results['1'][i]
+        print("{:<12} regular: {:>7.1f} B/record  compact: {:>7.1f} "
+              "B/record  saved: {:.0%}".format(
+                  name, regular / count, compact / count,
+                  1 - compact / regular))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--measure":
+        measure(int(sys.argv[2]))
+    else:
+        main()
@@ -1,20 +1,59 @@
 #!/usr/bin/env python3
 """ Base module
 """
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from functools import lru_cache
+from typing import TypeVar, List, Iterable, Tuple
+from os import getenv, path
+from threading import Thread
+from models.journal import Journal
+from models.lock import ClassLock
+from models.metrics import timed
+from models.snapshot import LazyObjects, read_snapshot, temporary_path, \
+    write_snapshot
 import json
+import os
 import uuid
 
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+INDEXES = {}
+INDEXED_VALUES = {}
+# class name -> sorted ids, built on first use by page()
+ORDERED_IDS = {}
+# class name -> attribute -> sorted (value, id), built on first use by
+# search_prefix()
+SORTED_INDEXES = {}
+JOURNAL_MAX_ENTRIES = 1000
+LOCKS = {}
+JOURNALS = {}
+SNAPSHOT_STATS = {}
+COMPACT_MODELS = getenv('COMPACT_MODELS', '0') not in ('', '0')
+
+
+@lru_cache(maxsize=None)
+def slot_names(cls: type) -> Tuple[str, ...]:
+    """ Attribute slots of a class and its parents, in definition order
+    """
+    names = []
+    for klass in reversed(cls.__mro__):
+        for name in klass.__dict__.get('__slots__', ()):
+            if name not in ('__dict__', '__weakref__'):
+                names.append(name)
+    return tuple(names)
 
 
 class Base():
     """ Base class
     """
+    # COMPACT_MODELS=1 stores attributes in slots instead of a __dict__
+    __slots__ = ('id', 'created_at', 'updated_at') if COMPACT_MODELS \
+        else ('__dict__', '__weakref__')
+    indexed_attributes = ()
+    # indexed attributes also kept sorted, for prefix searches
+    sorted_attributes = ()
 
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
@@ -22,6 +61,8 @@ class Base():
         s_class = str(self.__class__.__name__)
         if DATA.get(s_class) is None:
             DATA[s_class] = {}
+        if INDEXES.get(s_class) is None:
+            self.__class__.reset_indexes()
 
         self.id = kwargs.get('id', str(uuid.uuid4()))
         if kwargs.get('created_at') is not None:
@@ -35,6 +76,15 @@ class Base():
         else:
             self.updated_at = datetime.utcnow()
 
+    def __setattr__(self, name: str, value):
+        """ Set an attribute: a stored object changing an indexed
+            attribute is re-indexed at once, so search() sees the live
+            values and not only the saved ones
+        """
+        super().__setattr__(name, value)
+        if name in self.__class__.indexed_attributes:
+            self.__class__._reindex(self, name, value)
+
     def __eq__(self, other: TypeVar('Base')) -> bool:
         """ Equality
         """
@@ -48,7 +98,13 @@ class Base():
         """ Convert the object a JSON dictionary
         """
         result = {}
-        for key, value in self.__dict__.items():
+        attributes = []
+        for key in slot_names(self.__class__):
+            if hasattr(self, key):
+                attributes.append((key, getattr(self, key)))
+        if hasattr(self, '__dict__'):
+            attributes.extend(self.__dict__.items())
+        for key, value in attributes:
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -58,72 +114,552 @@ class Base():
         return result
 
     @classmethod
+    def journaling(cls) -> bool:
+        """ True if save/remove append to the journal instead of
+            rewriting the whole file (STORAGE_MODE=journal)
+        """
+        return getenv('STORAGE_MODE', 'json') == 'journal'
+
+    @classmethod
+    def snapshot_path(cls, binary: bool = None) -> str:
+        """ Path of the snapshot file, binary if SNAPSHOT_FORMAT=binary
+        """
+        if binary is None:
+            binary = getenv('SNAPSHOT_FORMAT', 'json') == 'binary'
+        return ".db_{}.{}".format(cls.__name__, "bin" if binary else "json")
+
+    @classmethod
+    def _lock(cls) -> ClassLock:
+        """ Lock of the class files, also held while DATA is written
+        """
+        s_class = cls.__name__
+        lock = LOCKS.get(s_class)
+        if lock is None:
+            lock = LOCKS.setdefault(
+                s_class, ClassLock(".db_{}.lock".format(s_class)))
+        return lock
+
+    @classmethod
+    def _compaction_lock(cls) -> ClassLock:
+        """ Lock held while a rotated journal is folded in the snapshot
+        """
+        s_class = cls.__name__ + ".compact"
+        lock = LOCKS.get(s_class)
+        if lock is None:
+            lock = LOCKS.setdefault(
+                s_class, ClassLock(".db_{}.lock".format(s_class)))
+        return lock
+
+    @classmethod
+    @timed('load')
     def load_from_file(cls):
-        """ Load all objects from file
+        """ Load all objects from file, then replay the journal
         """
         s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        DATA[s_class] = {}
-        if not path.exists(file_path):
+        journal_path = ".db_{}.journal".format(s_class)
+        old_path = journal_path + ".old"
+        # the compaction lock keeps the snapshot and the rotated journal
+        # consistent while they are read
+        with cls._lock(), cls._compaction_lock():
+            DATA[s_class] = {}
+            cls.reset_indexes()
+            file_path = cls.snapshot_path()
+            stat = cls._snapshot_stat(file_path)
+            if not path.exists(file_path):
+                # snapshot written before SNAPSHOT_FORMAT was changed
+                file_path = cls.snapshot_path(not file_path.endswith(".bin"))
+            if file_path.endswith(".bin") and path.exists(file_path):
+                cls._load_binary(file_path)
+            elif path.exists(file_path):
+                with open(file_path, 'r') as f:
+                    objs_json = json.load(f)
+                    for obj_id, obj_json in objs_json.items():
+                        obj = cls(**obj_json)
+                        DATA[s_class][obj_id] = obj
+                        cls._index(obj)
+
+            if path.exists(old_path):
+                # interrupted compaction: fold the rotated journal now
+                with open(old_path, 'rb') as f:
+                    Journal.replay_file(f, cls._apply_entry)
+                cls._write_snapshot(cls._snapshot_items())
+                stat = SNAPSHOT_STATS.get(s_class)
+                os.remove(old_path)
+
+            cls._journal().reset(cls._apply_entry)
+            # set last: readers of other threads wait for the reload
+            SNAPSHOT_STATS[s_class] = stat
+
+    @classmethod
+    def _apply_entry(cls, entry: dict):
+        """ Apply one journal entry to DATA
+        """
+        s_class = cls.__name__
+        if entry['op'] == 'save':
+            obj = cls(**entry['obj'])
+            DATA[s_class][obj.id] = obj
+            cls._index(obj)
+        elif entry['op'] == 'remove':
+            DATA[s_class].pop(entry['id'], None)
+            cls._unindex(entry['id'])
+
+    @classmethod
+    def _sync(cls):
+        """ Pick up the writes of other processes: tail the journal, or
+            reload a snapshot rewritten by another process
+        """
+        s_class = cls.__name__
+        if s_class not in SNAPSHOT_STATS:
+            # never loaded in this process
+            with cls._lock().thread_lock:
+                if s_class not in SNAPSHOT_STATS:
+                    cls.load_from_file()
+            return
+        if cls.journaling():
+            cls._tail_journal()
+            return
+        if SNAPSHOT_STATS[s_class] == cls._snapshot_stat():
             return
+        with cls._lock().thread_lock:
+            if SNAPSHOT_STATS.get(s_class) != cls._snapshot_stat():
+                cls.load_from_file()
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+    @classmethod
+    def _journal(cls) -> Journal:
+        """ Journal of the class
+        """
+        s_class = cls.__name__
+        journal = JOURNALS.get(s_class)
+        if journal is None:
+            journal = JOURNALS.setdefault(
+                s_class, Journal(".db_{}.journal".format(s_class)))
+        return journal
+
+    @classmethod
+    def _tail_journal(cls):
+        """ Apply the journal entries appended by other processes
+        """
+        journal = cls._journal()
+        if journal.up_to_date():
+            return
+        with cls._lock().thread_lock:
+            if not journal.tail(cls._apply_entry):
+                cls.load_from_file()
+
+    @classmethod
+    def _load_binary(cls, file_path: str):
+        """ Map a binary snapshot: objects are decoded on first access,
+            indexes are built from the values stored in its header
+        """
+        s_class = cls.__name__
+        mm, data_start, header = read_snapshot(file_path)
+        objs = LazyObjects(cls, mm, data_start, header['records'])
+        DATA[s_class] = objs
+        if header['fields'] != list(cls.indexed_attributes):
+            for obj in objs.values():
+                cls._index(obj)
+            return
+        for record in header['records']:
+            cls._index_values(record[0],
+                              dict(zip(header['fields'], record[3])))
+
+    @classmethod
+    def _snapshot_stat(cls, file_path: str = None) -> tuple:
+        """ Identity of the snapshot file: (inode, mtime) or None
+        """
+        if file_path is None:
+            file_path = cls.snapshot_path()
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns)
 
     @classmethod
+    def _write_snapshot(cls, objs: list):
+        """ Write objects to the snapshot file through a temporary file
+        """
+        file_path = cls.snapshot_path()
+        if file_path.endswith(".bin"):
+            write_snapshot(file_path, objs, cls.indexed_attributes)
+        else:
+            objs_json = {}
+            for obj in objs:
+                if type(obj) is tuple:
+                    objs_json[obj[0]] = json.loads(obj[1])
+                else:
+                    objs_json[obj.id] = obj.to_json(True)
+
+            tmp_path = temporary_path(file_path)
+            with open(tmp_path, 'w') as f:
+                json.dump(objs_json, f)
+            os.replace(tmp_path, file_path)
+        SNAPSHOT_STATS[cls.__name__] = cls._snapshot_stat(file_path)
+
+        other_path = cls.snapshot_path(not file_path.endswith(".bin"))
+        if path.exists(other_path):
+            os.remove(other_path)
+
+    @classmethod
+    def _snapshot_items(cls) -> list:
+        """ Current objects to snapshot, without decoding mapped records
+        """
+        objs = DATA[cls.__name__]
+        if isinstance(objs, LazyObjects):
+            return objs.snapshot_items()
+        return list(objs.values())
+
+    @classmethod
+    @timed('save_to_file')
     def save_to_file(cls):
         """ Save all objects to file
         """
-        s_class = cls.__name__
-        file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with cls._lock():
+            cls._write_snapshot(cls._snapshot_items())
+            journal = cls._journal()
+            journal.close()
+            journal.size = 0
+            for journal_path in (journal.path, journal.old_path):
+                if path.exists(journal_path):
+                    os.remove(journal_path)
+
+    @classmethod
+    @timed('append_to_journal')
+    def append_to_journal(cls, *entries: dict):
+        """ Append save/remove entries to the journal and start a
+            background compaction when it gets too long
+        """
+        lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+        with cls._lock():
+            cls._tail_journal()
+            journal = cls._journal()
+            journal.append(lines.encode('utf-8'), len(entries))
+            if journal.size >= JOURNAL_MAX_ENTRIES \
+                    and not journal.compacting \
+                    and not path.exists(journal.old_path):
+                # the rotated journal of another process may still
+                # be compacting
+                cls._start_compaction()
+
+    @classmethod
+    def _start_compaction(cls):
+        """ Rotate the journal and write a snapshot in a thread
+            (the class lock must be held)
+        """
+        journal = cls._journal()
+        identity = journal.rotate()
+        journal.compacting = True
+        objs = cls._snapshot_items()
+        Thread(target=cls._compact,
+               args=(objs, journal.old_path, identity),
+               daemon=True).start()
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _compact(cls, objs: list, old_path: str, identity: tuple):
+        """ Write the snapshot and drop the rotated journal, unless
+            load_from_file() of another process folded it meanwhile
+        """
+        try:
+            with cls._compaction_lock():
+                try:
+                    stat = os.stat(old_path)
+                except FileNotFoundError:
+                    return
+                if (stat.st_ino, stat.st_size) == identity:
+                    cls._write_snapshot(objs)
+                    os.remove(old_path)
+        finally:
+            cls._journal().compacting = False
 
+    @timed('save')
     def save(self):
         """ Save current object
         """
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
-        DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        with self.__class__._lock():
+            self.__class__._sync()
+            DATA[s_class][self.id] = self
+            self.__class__._index(self)
+            if self.__class__.journaling():
+                self.__class__.append_to_journal({'op': 'save',
+                                                  'obj': self.to_json(True)})
+            else:
+                self.__class__.save_to_file()
 
+    @timed('remove')
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
+        with self.__class__._lock():
+            self.__class__._sync()
+            if DATA[s_class].get(self.id) is None:
+                return
             del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+            self.__class__._unindex(self.id)
+            if self.__class__.journaling():
+                self.__class__.append_to_journal({'op': 'remove',
+                                                  'id': self.id})
+            else:
+                self.__class__.save_to_file()
+
+    @classmethod
+    @timed('remove_many')
+    def remove_many(cls, ids: Iterable[str]) -> int:
+        """ Remove objects by id with a single write, returns the number
+            of objects removed
+        """
+        s_class = cls.__name__
+        with cls._lock():
+            cls._sync()
+            removed = []
+            for obj_id in ids:
+                if obj_id not in DATA[s_class]:
+                    continue
+                del DATA[s_class][obj_id]
+                cls._unindex(obj_id)
+                removed.append(obj_id)
+            if not removed:
+                return 0
+            if cls.journaling():
+                cls.append_to_journal(*({'op': 'remove', 'id': obj_id}
+                                        for obj_id in removed))
+            else:
+                cls.save_to_file()
+            return len(removed)
+
+    @classmethod
+    def reset_indexes(cls):
+        """ Create empty indexes for all indexed attributes
+        """
+        s_class = cls.__name__
+        INDEXES[s_class] = {attr: {} for attr in cls.indexed_attributes}
+        INDEXED_VALUES[s_class] = {}
+        ORDERED_IDS.pop(s_class, None)
+        SORTED_INDEXES.pop(s_class, None)
 
     @classmethod
+    def _index(cls, obj: TypeVar('Base')):
+        """ Add (or refresh) an object in the indexes
+        """
+        values = {}
+        for attr in INDEXES[cls.__name__]:
+            values[attr] = getattr(obj, attr, None)
+        cls._index_values(obj.id, values)
+
+    @classmethod
+    def _index_values(cls, obj_id: str, values: dict):
+        """ Add (or refresh) the indexed values of an object
+        """
+        s_class = cls.__name__
+        old_values = cls._unindex_values(obj_id)
+        for attr, value in values.items():
+            INDEXES[s_class][attr].setdefault(value, {})[obj_id] = None
+        INDEXED_VALUES[s_class][obj_id] = values
+        cls._sort_values(obj_id, old_values, values)
+        ids = ORDERED_IDS.get(s_class)
+        if ids is not None:
+            position = bisect_left(ids, obj_id)
+            if position == len(ids) or ids[position] != obj_id:
+                ids.insert(position, obj_id)
+
+    @classmethod
+    def _reindex(cls, obj: TypeVar('Base'), name: str, value):
+        """ Refresh the indexes of a stored object whose indexed
+            attribute name was set to value
+        """
+        values = INDEXED_VALUES.get(cls.__name__, {}).get(
+            getattr(obj, 'id', None))
+        if values is None or values.get(name) == value:
+            # not stored yet (or a copy being built), or unchanged
+            return
+        with cls._lock().thread_lock:
+            if DATA[cls.__name__].get(obj.id) is obj:
+                cls._index(obj)
+
+    @classmethod
+    def _unindex(cls, obj_id: str):
+        """ Remove an object from the indexes
+        """
+        old_values = cls._unindex_values(obj_id)
+        cls._sort_values(obj_id, old_values, None)
+        ids = ORDERED_IDS.get(cls.__name__)
+        if ids is not None:
+            position = bisect_left(ids, obj_id)
+            if position < len(ids) and ids[position] == obj_id:
+                del ids[position]
+
+    @classmethod
+    def _unindex_values(cls, obj_id: str) -> dict:
+        """ Remove an object from the attribute indexes, returns the
+            values it was indexed with (None if it was not)
+        """
+        s_class = cls.__name__
+        values = INDEXED_VALUES[s_class].pop(obj_id, None)
+        if values is None:
+            return None
+        for attr, value in values.items():
+            bucket = INDEXES[s_class][attr].get(value)
+            if bucket is None:
+                continue
+            bucket.pop(obj_id, None)
+            if len(bucket) == 0:
+                del INDEXES[s_class][attr][value]
+        return values
+
+    @classmethod
+    def _sort_values(cls, obj_id: str, old_values: dict, values: dict):
+        """ Move an object in the sorted indexes already built (only
+            string values are sorted)
+        """
+        indexes = SORTED_INDEXES.get(cls.__name__)
+        if not indexes:
+            return
+        for attr, entries in indexes.items():
+            old = old_values.get(attr) if old_values is not None else None
+            new = values.get(attr) if values is not None else None
+            if old == new and old_values is not None and values is not None:
+                continue
+            if isinstance(old, str):
+                position = bisect_left(entries, (old, obj_id))
+                if position < len(entries) \
+                        and entries[position] == (old, obj_id):
+                    del entries[position]
+            if isinstance(new, str):
+                insort(entries, (new, obj_id))
+
+    @classmethod
+    def _sorted_index(cls, attr: str) -> List[Tuple[str, str]]:
+        """ (value, id) of the objects sorted, kept up to date once built
+        """
+        s_class = cls.__name__
+        entries = SORTED_INDEXES.get(s_class, {}).get(attr)
+        if entries is None:
+            with cls._lock().thread_lock:
+                indexes = SORTED_INDEXES.setdefault(s_class, {})
+                entries = indexes.get(attr)
+                if entries is None:
+                    entries = indexes[attr] = sorted(
+                        (values[attr], obj_id) for obj_id, values
+                        in INDEXED_VALUES[s_class].items()
+                        if isinstance(values.get(attr), str))
+        return entries
+
+    @classmethod
+    def _indexed_candidates(cls, attributes: dict) -> List[TypeVar('Base')]:
+        """ Objects possibly matching attributes, from the smallest index
+            bucket - None if no indexed attribute can be used
+        """
+        s_class = cls.__name__
+        indexes = INDEXES.get(s_class, {})
+        best = None
+        for k, v in attributes.items():
+            if k not in indexes:
+                continue
+            try:
+                bucket = indexes[k].get(v, {})
+            except TypeError:
+                continue
+            if best is None or len(bucket) < len(best):
+                best = bucket
+        if best is None:
+            return None
+        objs = DATA[s_class]
+        return [objs[obj_id] for obj_id in list(best) if obj_id in objs]
+
+    @classmethod
+    @timed('count')
     def count(cls) -> int:
         """ Count all objects
         """
         s_class = cls.__name__
+        cls._sync()
         return len(DATA[s_class].keys())
 
     @classmethod
+    @timed('all')
     def all(cls) -> Iterable[TypeVar('Base')]:
         """ Return all objects
         """
         return cls.search()
 
     @classmethod
+    @timed('get')
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
         """
         s_class = cls.__name__
+        cls._sync()
         return DATA[s_class].get(id)
 
     @classmethod
+    def _ordered_ids(cls) -> List[str]:
+        """ Sorted ids of the objects, kept up to date once built
+        """
+        s_class = cls.__name__
+        ids = ORDERED_IDS.get(s_class)
+        if ids is None:
+            with cls._lock().thread_lock:
+                ids = ORDERED_IDS.get(s_class)
+                if ids is None:
+                    ids = ORDERED_IDS[s_class] = sorted(DATA[s_class])
+        return ids
+
+    @classmethod
+    @timed('page')
+    def page(cls, after: str = None,
+             limit: int = 100) -> List[TypeVar('Base')]:
+        """ Up to limit objects ordered by id, after the id `after`:
+            pages stay consistent while objects are added or removed
+        """
+        s_class = cls.__name__
+        cls._sync()
+        ids = cls._ordered_ids()
+        start = 0 if after is None else bisect_right(ids, after)
+        objs = DATA[s_class]
+        page = []
+        for obj_id in ids[start:start + limit]:
+            obj = objs.get(obj_id)
+            if obj is not None:
+                page.append(obj)
+        return page
+
+    @classmethod
+    @timed('search_prefix')
+    def search_prefix(cls, attr: str, prefix: str,
+                      after: Tuple[str, str] = None,
+                      limit: int = 100) -> List[TypeVar('Base')]:
+        """ Up to limit objects whose attr (one of sorted_attributes)
+            starts with prefix, ordered by (attr, id), after the
+            (value, id) `after`
+        """
+        if attr not in cls.sorted_attributes:
+            raise ValueError("{} is not sorted".format(attr))
+        s_class = cls.__name__
+        cls._sync()
+        entries = cls._sorted_index(attr)
+        if after is None or after[0] < prefix:
+            start = bisect_left(entries, (prefix,))
+        else:
+            start = bisect_right(entries, tuple(after))
+        objs = DATA[s_class]
+        found = []
+        for value, obj_id in entries[start:start + limit]:
+            if not value.startswith(prefix):
+                break
+            obj = objs.get(obj_id)
+            # skip an object changed but not saved yet
+            if obj is not None and getattr(obj, attr, None) == value:
+                found.append(obj)
+        return found
+
+    @classmethod
+    @timed('search')
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+            (equality on indexed attributes uses the indexes, kept up to
+            date as attributes are set)
         """
         s_class = cls.__name__
 
@@ -135,4 +671,8 @@ class Base():
                     return False
             return True
 
-        return list(filter(_search, DATA[s_class].values()))
+        cls._sync()
+        objs = cls._indexed_candidates(attributes)
+        if objs is None:
+            objs = list(DATA[s_class].values())
+        return list(filter(_search, objs))
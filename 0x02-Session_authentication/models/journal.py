@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+""" Journal module: append-only log of the save/remove entries of a
+model class, shared by all the processes using the same files
+
+Each journal file starts with a {"generation": n} line. A compaction
+renames the journal to `<path>.old` and creates generation n + 1: a
+reader that finds a gap in the generations missed a whole journal and
+must reload the snapshot.
+"""
+from typing import BinaryIO, Callable, Optional, Tuple
+import json
+import os
+
+
+class Journal():
+    """ Journal of one model class: writes need the class lock, the
+        entries written by other processes are picked up by tail()
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize a journal stored in file_path
+        """
+        self.path = file_path
+        self.old_path = file_path + ".old"
+        self.size = 0
+        self.generation = None
+        self.compacting = False
+        self._reader = None
+        self._writer = None
+        # (inode, offset) of the reader, replaced as a whole under the
+        # class thread lock: up_to_date() reads it without the lock
+        self.position = None
+
+    @staticmethod
+    def replay_file(f: BinaryIO, apply: Callable[[dict], None]) -> int:
+        """ Apply the complete entries of an open journal file,
+            returns their number
+        """
+        count = 0
+        while True:
+            position = f.tell()
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                # entry being written by another process
+                f.seek(position)
+                return count
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # torn write of a crashed process
+                continue
+            if 'op' in entry:
+                apply(entry)
+                count += 1
+
+    def _open_reader(self) -> Optional[Tuple[BinaryIO, int]]:
+        """ Open the journal file and read its generation, None if it
+            does not exist or its header is not written yet
+        """
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return None
+        line = f.readline()
+        if not line.endswith(b"\n"):
+            f.close()
+            return None
+        generation = json.loads(line).get('generation')
+        if generation is None:
+            # journal written before generations: replay it all
+            f.seek(0)
+            generation = 0
+        return f, generation
+
+    def _mark(self):
+        """ Record the position of the reader (the class thread lock
+            must be held)
+        """
+        if self._reader is None:
+            self.position = None
+        else:
+            self.position = (os.fstat(self._reader.fileno()).st_ino,
+                             self._reader.tell())
+
+    def close(self):
+        """ Close the open files of the journal
+        """
+        for f in (self._reader, self._writer):
+            if f is not None:
+                f.close()
+        self._reader = None
+        self._writer = None
+        self.generation = None
+        self.position = None
+
+    def reset(self, apply: Callable[[dict], None]):
+        """ Read the journal from its start
+        """
+        self.close()
+        self.size = 0
+        opened = self._open_reader()
+        if opened is not None:
+            self._reader, self.generation = opened
+            self.size = self.replay_file(self._reader, apply)
+        self._mark()
+
+    def up_to_date(self) -> bool:
+        """ True if no entry was appended since the last read
+            (lock-free: the reader itself may be replaced meanwhile,
+            only the position recorded with it is compared)
+        """
+        position = self.position
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return position is None
+        return position == (stat.st_ino, stat.st_size)
+
+    def tail(self, apply: Callable[[dict], None]) -> bool:
+        """ Apply the entries appended since the last read (the class
+            thread lock must be held), False if a reload is needed
+        """
+        try:
+            return self._tail(apply)
+        finally:
+            self._mark()
+
+    def _tail(self, apply: Callable[[dict], None]) -> bool:
+        """ Body of tail()
+        """
+        # stat before draining: entries are only appended to a journal
+        # before its rotation
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            stat = None
+        if self._reader is not None:
+            position = self._reader.tell()
+            self.size += self.replay_file(self._reader, apply)
+            if stat is not None \
+                    and os.fstat(self._reader.fileno()).st_ino == stat.st_ino \
+                    and position <= stat.st_size:
+                return True
+        if stat is None:
+            return True
+
+        opened = self._open_reader()
+        if opened is None:
+            return True
+        f, generation = opened
+        if self._reader is None or generation != self.generation + 1:
+            # a whole journal may have been compacted meanwhile
+            f.close()
+            return False
+        self._reader.close()
+        self._reader, self.generation = f, generation
+        self.size = self.replay_file(f, apply)
+        return True
+
+    def _open_writer(self, generation: int):
+        """ Open (or create) the journal file for appending
+            (the class lock must be held)
+        """
+        self._writer = open(self.path, 'ab')
+        if self._writer.tell() == 0:
+            header = json.dumps({'generation': generation}) + "\n"
+            self._writer.write(header.encode('utf-8'))
+            self._writer.flush()
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # end the torn write of a crashed process
+                self._writer.write(b"\n")
+                self._writer.flush()
+
+    def append(self, lines: bytes, count: int = 1):
+        """ Append count entries, after tail() (the class lock must be
+            held)
+        """
+        if self._writer is not None:
+            try:
+                rotated = os.fstat(self._writer.fileno()).st_ino != \
+                    os.stat(self.path).st_ino
+            except FileNotFoundError:
+                rotated = True
+            if rotated:
+                self._writer.close()
+                self._writer = None
+        if self._writer is None:
+            self._open_writer(1 if self.generation is None
+                              else self.generation + 1)
+        self._writer.write(lines)
+        self._writer.flush()
+        if self._reader is None:
+            self._reader, self.generation = self._open_reader()
+        # our own entries are already applied
+        self._reader.seek(0, os.SEEK_END)
+        self.size += count
+        self._mark()
+
+    def rotate(self) -> Tuple[int, int]:
+        """ Rename the journal for a compaction and start the next
+            generation (the class lock must be held), returns the
+            identity (inode, size) of the rotated file
+        """
+        os.replace(self.path, self.old_path)
+        stat = os.stat(self.old_path)
+        generation = self.generation
+        self.close()
+        self._open_writer(generation + 1)
+        self._reader, self.generation = self._open_reader()
+        self._reader.seek(0, os.SEEK_END)
+        self.size = 0
+        self._mark()
+        return (stat.st_ino, stat.st_size)
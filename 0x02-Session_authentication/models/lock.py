@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+""" Lock module
+"""
+from threading import RLock
+import fcntl
+import os
+
+
+class ClassLock():
+    """ Re-entrant lock of the files of one model class: threads of the
+        process are serialized by an RLock, other processes by an
+        exclusive flock on a lock file
+    """
+
+    def __init__(self, file_path: str):
+        """ Initialize the lock for a lock file
+        """
+        self.file_path = file_path
+        self.thread_lock = RLock()
+        self._fd = None
+        self._pid = None
+        self._depth = 0
+
+    def __enter__(self) -> 'ClassLock':
+        """ Acquire the thread lock, then the file lock
+        """
+        self.thread_lock.acquire()
+        if self._depth == 0:
+            if self._pid != os.getpid():
+                # a forked worker must not share the parent's descriptor:
+                # flock would not exclude the two processes
+                self._fd = os.open(self.file_path, os.O_RDWR | os.O_CREAT,
+                                   0o644)
+                self._pid = os.getpid()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *args):
+        """ Release the file lock, then the thread lock
+        """
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self.thread_lock.release()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+""" Metrics module: latency histograms in the Prometheus text format
+"""
+from bisect import bisect_left
+from functools import wraps
+from os import getenv
+from threading import Lock
+from typing import Callable, List, Tuple
+import time
+
+
+# seconds, from a dict lookup to a slow snapshot rewrite
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ENABLED = getenv("METRICS", "1") != "0"
+
+
+class Timer():
+    """ Context manager observing its duration in a histogram
+    """
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram: 'Histogram', labels: Tuple[str, ...]):
+        """ Initialize a timer for a set of label values
+        """
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> 'Timer':
+        """ Start timing
+        """
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        """ Observe the elapsed time
+        """
+        self.histogram.observe(time.perf_counter() - self.start,
+                               *self.labels)
+
+
+class Histogram():
+    """ Histogram of durations by label values: a count per bucket (not
+        cumulated until rendered), the sum and the count
+    """
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = BUCKETS):
+        """ Initialize an empty histogram
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *labels: str):
+        """ Record a duration in seconds
+        """
+        if not ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # bucket counts, then +Inf, sum
+                series = self._series[labels] = \
+                    [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, *labels: str) -> Timer:
+        """ Context manager timing a block
+        """
+        return Timer(self, labels)
+
+    def render(self) -> List[str]:
+        """ Lines of the histogram in the Prometheus text format
+        """
+        lines = ["# HELP {} {}".format(self.name, self.documentation),
+                 "# TYPE {} histogram".format(self.name)]
+        with self._lock:
+            series = sorted((labels, list(values))
+                            for labels, values in self._series.items())
+        bounds = [repr(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, values in series:
+            pairs = ['{}="{}"'.format(name, escape(value)) for name, value
+                     in zip(self.label_names, labels)]
+            cumulated = 0
+            for bound, count in zip(bounds, values):
+                cumulated += count
+                lines.append("{}_bucket{{{}}} {}".format(
+                    self.name, ",".join(pairs + ['le="{}"'.format(bound)]),
+                    cumulated))
+            suffix = "{" + ",".join(pairs) + "}" if pairs else ""
+            lines.append("{}_sum{} {!r}".format(self.name, suffix,
+                                                values[-1]))
+            lines.append("{}_count{} {}".format(self.name, suffix,
+                                                cumulated))
+        return lines
+
+
+def escape(value: str) -> str:
+    """ Label value escaped for the text format
+    """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Duration of the HTTP requests.",
+    ("method", "route", "status"))
+AUTH_SECONDS = Histogram(
+    "auth_phase_duration_seconds",
+    "Duration of each phase of the authentication of a request.",
+    ("phase",))
+STORAGE_SECONDS = Histogram(
+    "storage_operation_duration_seconds",
+    "Duration of the storage operations of the models.",
+    ("model", "operation"))
+HISTOGRAMS = (REQUEST_SECONDS, AUTH_SECONDS, STORAGE_SECONDS)
+
+
+def timed(operation: str) -> Callable:
+    """ Decorator timing a method of a model (under @classmethod for
+        class methods) in STORAGE_SECONDS
+    """
+    def decorator(method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(self_or_cls, *args, **kwargs):
+            if not ENABLED:
+                return method(self_or_cls, *args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return method(self_or_cls, *args, **kwargs)
+            finally:
+                cls = self_or_cls if isinstance(self_or_cls, type) \
+                    else self_or_cls.__class__
+                STORAGE_SECONDS.observe(time.perf_counter() - start,
+                                        cls.__name__, operation)
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    """ All the metrics of the process in the Prometheus text format
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
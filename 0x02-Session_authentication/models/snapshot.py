@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+""" Snapshot module: binary, memory-mapped snapshot of a model class
+
+Layout of a `.db_<Class>.bin` file:
+  - MAGIC
+  - header length (unsigned 64 bits, little endian)
+  - header: JSON {"fields": [...], "records": [[id, offset, length,
+    [indexed values]], ...]}
+  - records: JSON objects (`to_json(True)`), offsets relative to the
+    end of the header
+"""
+from collections.abc import MutableMapping
+from threading import get_ident, Lock
+from typing import Iterable, Iterator, List, Tuple, TypeVar
+import json
+import mmap
+import os
+import struct
+
+
+MAGIC = b"BASEDB1\n"
+HEADER_LEN = struct.Struct("<Q")
+
+
+def temporary_path(file_path: str) -> str:
+    """ Temporary file to write before renaming it to file_path, unique
+        per process and thread
+    """
+    return "{}.{}.{}.tmp".format(file_path, os.getpid(), get_ident())
+
+
+def write_snapshot(file_path: str, objs: Iterable[TypeVar('Base')],
+                   fields: List[str]):
+    """ Write objects in the binary format through a temporary file,
+        `objs` may contain (id, record bytes, indexed values) tuples
+    """
+    records = []
+    chunks = []
+    offset = 0
+    for obj in objs:
+        if type(obj) is tuple:
+            # record copied from a mapped snapshot, never decoded
+            obj_id, chunk, values = obj
+        else:
+            obj_id = obj.id
+            chunk = json.dumps(obj.to_json(True)).encode('utf-8')
+            values = [getattr(obj, field, None) for field in fields]
+        records.append([obj_id, offset, len(chunk), values])
+        chunks.append(chunk)
+        offset += len(chunk)
+    header = json.dumps({"fields": list(fields),
+                         "records": records}).encode('utf-8')
+
+    tmp_path = temporary_path(file_path)
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(HEADER_LEN.pack(len(header)))
+        f.write(header)
+        for chunk in chunks:
+            f.write(chunk)
+    os.replace(tmp_path, file_path)
+
+
+def read_snapshot(file_path: str) -> Tuple[mmap.mmap, int, dict]:
+    """ Map a binary snapshot, returns (map, data offset, header)
+    """
+    with open(file_path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:len(MAGIC)] != MAGIC:
+        mm.close()
+        raise ValueError("{} is not a snapshot file".format(file_path))
+    start = len(MAGIC) + HEADER_LEN.size
+    header_len, = HEADER_LEN.unpack(mm[len(MAGIC):start])
+    header = json.loads(mm[start:start + header_len])
+    return mm, start + header_len, header
+
+
+class LazyObjects(MutableMapping):
+    """ id -> object mapping backed by a mapped snapshot: records are
+        only decoded the first time they are accessed
+    """
+
+    def __init__(self, cls: type, mm: mmap.mmap, data_start: int,
+                 records: List[list]):
+        """ Initialize with the records of the snapshot header
+        """
+        self._cls = cls
+        self._mm = mm
+        self._start = data_start
+        self._lock = Lock()
+        # values are either objects or (offset, length, indexed values)
+        self._entries = {r[0]: (r[1], r[2], r[3]) for r in records}
+
+    def _decode(self, key: str, entry: tuple) -> TypeVar('Base'):
+        """ Build the object of a record and keep it
+        """
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                # decoded (or replaced) by another thread meanwhile
+                return self._entries.get(key)
+            offset, length, _ = entry
+            begin = self._start + offset
+            obj = self._cls(**json.loads(self._mm[begin:begin + length]))
+            self._entries[key] = obj
+            return obj
+
+    def __getitem__(self, key: str) -> TypeVar('Base'):
+        """ Object by id, decoded on first access
+        """
+        entry = self._entries[key]
+        if type(entry) is tuple:
+            return self._decode(key, entry)
+        return entry
+
+    def get(self, key: str, default=None) -> TypeVar('Base'):
+        """ Object by id or default
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        if type(entry) is tuple:
+            return self._decode(key, entry)
+        return entry
+
+    def __setitem__(self, key: str, obj: TypeVar('Base')):
+        """ Store a live object
+        """
+        self._entries[key] = obj
+
+    def __delitem__(self, key: str):
+        """ Remove an object
+        """
+        del self._entries[key]
+
+    def __contains__(self, key: str) -> bool:
+        """ Membership without decoding
+        """
+        return key in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        """ Iterate over a copy of the ids: writers may run meanwhile
+        """
+        return iter(list(self._entries))
+
+    def values(self) -> List[TypeVar('Base')]:
+        """ All objects, skipping the ones removed while decoding
+        """
+        objs = []
+        for key in list(self._entries):
+            obj = self.get(key)
+            if obj is not None:
+                objs.append(obj)
+        return objs
+
+    def __len__(self) -> int:
+        """ Number of objects
+        """
+        return len(self._entries)
+
+    def snapshot_items(self) -> list:
+        """ Objects, with undecoded records as (id, bytes, values)
+        """
+        items = []
+        for key, entry in list(self._entries.items()):
+            if type(entry) is tuple:
+                begin = self._start + entry[0]
+                entry = (key, self._mm[begin:begin + entry[1]], entry[2])
+            items.append(entry)
+        return items
+
+    def decoded(self) -> int:
+        """ Number of records already decoded
+        """
+        return sum(1 for v in self._entries.values() if type(v) is not tuple)
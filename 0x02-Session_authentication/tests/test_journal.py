@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+""" Tests of the journal read by several threads while other processes
+append to it
+"""
+import errno
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models.journal import Journal  # noqa: E402
+
+
+WRITER = """
+from models.user import User
+for i in range({count}):
+    User(email="user{{}}@example.com".format(i)).save()
+"""
+
+READERS = """
+import sys
+import threading
+import traceback
+from models.user import User
+
+errors = []
+done = threading.Event()
+
+
+def search():
+    while not done.is_set():
+        try:
+            User.search({{'email': "user0@example.com"}})
+        except Exception:
+            errors.append(traceback.format_exc())
+            done.set()
+
+
+threads = [threading.Thread(target=search) for _ in range(4)]
+for thread in threads:
+    thread.start()
+sys.stdin.read()
+done.set()
+for thread in threads:
+    thread.join()
+sys.stdout.write("".join(errors))
+print(len(User.search({{'email': "user{last}@example.com"}})))
+"""
+
+
+class ClosedFile():
+    """ File object whose descriptor was closed by another thread
+    """
+
+    def fileno(self):
+        """ Fail as a closed descriptor does
+        """
+        raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+
+    tell = fileno
+
+
+class JournalTest(unittest.TestCase):
+    """ Freshness checks racing the reads of the journal
+    """
+
+    def setUp(self):
+        """ Work in a temporary directory
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, ".db_User.journal")
+
+    def tearDown(self):
+        """ Remove the temporary directory
+        """
+        self.tmp.cleanup()
+
+    def test_up_to_date_while_reader_replaced(self):
+        """ up_to_date() never fails while the reader is reopened
+        """
+        journal = Journal(self.path)
+        writer = Journal(self.path)
+        lock = threading.Lock()
+        errors = []
+        done = threading.Event()
+
+        def check():
+            while not done.is_set():
+                try:
+                    journal.up_to_date()
+                except Exception as e:
+                    errors.append(e)
+                    done.set()
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, interval)
+        threads = [threading.Thread(target=check) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 1
+        i = 0
+        while time.monotonic() < deadline and not done.is_set():
+            writer.append(b'{"op": "save"}\n')
+            with lock:
+                if i % 2:
+                    journal.tail(lambda entry: None)
+                else:
+                    journal.reset(lambda entry: None)
+            i += 1
+        done.set()
+        for thread in threads:
+            thread.join()
+        writer.close()
+        self.assertEqual(errors, [])
+        with lock:
+            journal.tail(lambda entry: None)
+        self.assertTrue(journal.up_to_date())
+        writer.append(b'{"op": "save"}\n')
+        self.assertFalse(journal.up_to_date())
+        journal.close()
+        writer.close()
+
+    def test_up_to_date_does_not_use_reader(self):
+        """ up_to_date() only compares the file with the last position
+            read, the reader may be closed by another thread meanwhile
+        """
+        journal = Journal(self.path)
+        self.assertTrue(journal.up_to_date())
+        Journal(self.path).append(b'{"op": "save"}\n')
+        self.assertFalse(journal.up_to_date())
+        journal.reset(lambda entry: None)
+        reader, journal._reader = journal._reader, ClosedFile()
+        try:
+            self.assertTrue(journal.up_to_date())
+        finally:
+            journal._reader = reader
+            journal.close()
+
+    def test_search_while_other_process_saves(self):
+        """ Threads searching see the saves of another process
+        """
+        count = 300
+        env = dict(os.environ, STORAGE_MODE="journal", PYTHONPATH=ROOT)
+        readers = subprocess.Popen(
+            [sys.executable, "-c", READERS.format(last=count - 1)],
+            cwd=self.tmp.name, env=env, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        writer = subprocess.run(
+            [sys.executable, "-c", WRITER.format(count=count)],
+            cwd=self.tmp.name, env=env, stderr=subprocess.PIPE,
+            universal_newlines=True, timeout=120)
+        self.assertEqual(writer.returncode, 0, writer.stderr)
+        out, err = readers.communicate("", timeout=120)
+        self.assertEqual(readers.returncode, 0, err)
+        self.assertEqual(out, "1\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
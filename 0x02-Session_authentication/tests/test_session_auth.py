@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+""" Tests of the logout of SessionAuth
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import Flask, request  # noqa: E402
+from api.v1.auth.session_auth import SessionAuth  # noqa: E402
+from api.v1.auth.session_store import MemoryStore  # noqa: E402
+
+
+class DestroySessionTest(unittest.TestCase):
+    """ SessionAuth.destroy_session with a memory store
+    """
+
+    def setUp(self):
+        """ A fresh store and app
+        """
+        patcher = mock.patch.object(SessionAuth, 'user_id_by_session_id',
+                                    MemoryStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.app = Flask(__name__)
+        self.auth = SessionAuth()
+        self.cookie = os.getenv('SESSION_NAME', '_my_session_id')
+
+    def logout(self, session_id: str) -> bool:
+        """ destroy_session for a request carrying session_id
+        """
+        headers = {"Cookie": "{}={}".format(self.cookie, session_id)}
+        with mock.patch.dict(os.environ, {'SESSION_NAME': self.cookie}), \
+                self.app.test_request_context(headers=headers):
+            return self.auth.destroy_session(request)
+
+    def test_logout(self):
+        """ A live session is destroyed once
+        """
+        session_id = self.auth.create_session("u1")
+        self.assertTrue(self.logout(session_id))
+        self.assertIsNone(self.auth.user_id_for_session_id(session_id))
+        self.assertFalse(self.logout(session_id))
+
+    def test_concurrent_logout(self):
+        """ The store entry removed by a racing logout is not an error
+        """
+        session_id = self.auth.create_session("u1")
+        with mock.patch.object(SessionAuth, 'session_user_id',
+                               return_value="u1"):
+            self.auth.user_id_by_session_id.delete(session_id)
+            self.assertTrue(self.logout(session_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+""" Tests of the Redis session store against a fake RESP server
+"""
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from api.v1.auth.session_store import RedisError, RedisStore  # noqa: E402
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """ Connection of a client of the fake server
+    """
+
+    def handle(self):
+        """ Answer the commands until the client or the server closes
+        """
+        server = self.server
+        with server.lock:
+            server.accepted += 1
+            server.connections.append(self.connection)
+        try:
+            self.serve(server)
+        finally:
+            with server.lock:
+                if self.connection in server.connections:
+                    server.connections.remove(self.connection)
+
+    def serve(self, server: 'FakeRedis'):
+        """ Reply to each command
+        """
+        while True:
+            try:
+                line = self.rfile.readline()
+            except OSError:
+                return
+            if not line:
+                return
+            args = []
+            for _ in range(int(line[1:])):
+                length = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(length + 2)[:-2].decode())
+            with server.lock:
+                server.commands.append(args)
+                reply = server.run(args)
+            if args[0].upper() in server.close_after:
+                # ran the command, but the client never gets the reply
+                return
+            try:
+                self.wfile.write(reply)
+            except OSError:
+                return
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """ Redis-compatible server keeping strings in a dict: GET, SET
+        (with EX), DEL, AUTH and SELECT
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password: str = None):
+        """ Serve on a free port of 127.0.0.1 in a thread
+        """
+        super().__init__(("127.0.0.1", 0), FakeRedisHandler)
+        self.password = password
+        self.lock = threading.Lock()
+        self.data = {}
+        self.commands = []
+        self.accepted = 0
+        self.connections = []
+        self.close_after = set()
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self) -> str:
+        """ URL of the server
+        """
+        return "redis://127.0.0.1:{}".format(self.server_address[1])
+
+    def run(self, args: list) -> bytes:
+        """ Reply to a command
+        """
+        name = args[0].upper()
+        if name == "AUTH":
+            if args[1] != self.password:
+                return b"-WRONGPASS invalid password\r\n"
+            return b"+OK\r\n"
+        if name == "SELECT":
+            return b"+OK\r\n"
+        if name == "SET":
+            expires_at = None
+            if len(args) == 5 and args[3].upper() == "EX":
+                expires_at = time.time() + int(args[4])
+            self.data[args[1]] = (args[2], expires_at)
+            return b"+OK\r\n"
+        if name == "GET":
+            value, expires_at = self.data.get(args[1], (None, None))
+            if value is None or expires_at is not None \
+                    and expires_at <= time.time():
+                return b"$-1\r\n"
+            value = value.encode()
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == "DEL":
+            count = sum(self.data.pop(key, None) is not None
+                        for key in args[1:])
+            return b":%d\r\n" % count
+        return b"-ERR unknown command\r\n"
+
+    def drop_clients(self):
+        """ Close the connections of all the clients
+        """
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def stop(self):
+        """ Stop serving
+        """
+        self.shutdown()
+        self.server_close()
+        self.drop_clients()
+
+
+class RedisStoreTest(unittest.TestCase):
+    """ RedisStore against FakeRedis
+    """
+
+    def setUp(self):
+        """ Start a fake server
+        """
+        self.server = FakeRedis(password="secret")
+        self.url = "redis://:secret@127.0.0.1:{}/2".format(
+            self.server.server_address[1])
+
+    def tearDown(self):
+        """ Stop the fake server
+        """
+        self.server.stop()
+
+    def test_set_get_delete(self):
+        """ Session infos round trip as JSON
+        """
+        store = RedisStore(self.url)
+        self.assertIsNone(store.get("a"))
+        self.assertEqual(store.get("a", "default"), "default")
+        store.set("a", {"user_id": "u1", "created_at": 1.5})
+        self.assertEqual(store.get("a"), {"user_id": "u1", "created_at": 1.5})
+        self.assertIn("session:a", self.server.data)
+        self.assertTrue("a" in store)
+        self.assertTrue(store.delete("a"))
+        self.assertFalse(store.delete("a"))
+        self.assertIsNone(store.get("a"))
+        with self.assertRaises(KeyError):
+            del store["a"]
+
+    def test_set_many_and_pop(self):
+        """ set_many stores all the infos, pop returns the deleted one
+        """
+        store = RedisStore(self.url)
+        store.set_many({"a": {"user_id": "u1"}, "b": {"user_id": "u2"}},
+                       ttl=60)
+        self.assertEqual(store.pop("b"), {"user_id": "u2"})
+        self.assertIsNone(store.pop("b"))
+        self.assertEqual(store["a"], {"user_id": "u1"})
+
+    def test_expiry(self):
+        """ Sessions set with a ttl are expired by the server
+        """
+        store = RedisStore(self.url)
+        store.set("a", {"user_id": "u1"}, ttl=1)
+        store.set("b", {"user_id": "u2"})
+        self.assertIn(["SET", "session:a", '{"user_id": "u1"}', "EX", "1"],
+                      self.server.commands)
+        self.assertEqual(store.get("a"), {"user_id": "u1"})
+        time.sleep(1.1)
+        self.assertIsNone(store.get("a"))
+        self.assertEqual(store.get("b"), {"user_id": "u2"})
+
+    def test_setup_commands(self):
+        """ A new connection authenticates and selects the database
+        """
+        store = RedisStore(self.url)
+        store.get("a")
+        self.assertEqual(self.server.commands[:2],
+                         [["AUTH", "secret"], ["SELECT", "2"]])
+        bad = RedisStore("redis://:wrong@127.0.0.1:{}".format(
+            self.server.server_address[1]))
+        with self.assertRaises(RedisError):
+            bad.get("a")
+        self.assertEqual(bad._opened, 0)
+
+    def test_pooled_connections(self):
+        """ Connections are reused, never more than pool_size
+        """
+        store = RedisStore(self.url, pool_size=2)
+        for i in range(10):
+            store.set(str(i), i)
+        self.assertEqual(self.server.accepted, 1)
+
+        errors = []
+
+        def work():
+            try:
+                for i in range(50):
+                    self.assertEqual(store.get(str(i % 10)), i % 10)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(self.server.accepted, 2)
+        self.assertLessEqual(store._opened, 2)
+
+    def test_reconnect_after_peer_closes(self):
+        """ A pooled connection closed by the server is replaced
+        """
+        store = RedisStore(self.url, pool_size=2)
+        store.set("a", {"user_id": "u1"})
+        self.server.drop_clients()
+        self.assertEqual(store.get("a"), {"user_id": "u1"})
+        self.assertEqual(self.server.accepted, 2)
+        self.assertEqual(store._opened, 1)
+
+    def test_no_retry_once_sent(self):
+        """ Commands the server may have run are not sent again
+        """
+        store = RedisStore(self.url)
+        store.set("a", {"user_id": "u1"})
+        self.server.close_after.add("DEL")
+        with self.assertRaises(ConnectionError):
+            store.delete("a")
+        self.assertEqual([c[0] for c in self.server.commands].count("DEL"),
+                         1)
+        self.assertNotIn("session:a", self.server.data)
+        self.assertEqual(store._opened, 0)
+
+    def test_retry_on_send_failure(self):
+        """ Commands refused on send go to a new connection
+        """
+        store = RedisStore(self.url, pool_size=2)
+        store.set("a", {"user_id": "u1"})
+        conn = store._pool.get_nowait()
+        conn.sock.shutdown(socket.SHUT_WR)
+        store._pool.put(conn)
+        self.assertEqual(store.get("a"), {"user_id": "u1"})
+        self.assertEqual(self.server.accepted, 2)
+        self.assertEqual(store._opened, 1)
+
+    def test_server_down(self):
+        """ Failing connections are not counted in the pool
+        """
+        store = RedisStore(self.url, pool_size=1)
+        store.set("a", 1)
+        self.server.stop()
+        with self.assertRaises(ConnectionError):
+            store.get("a")
+        self.assertEqual(store._opened, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,7 @@
 
 from auth import Auth
 from flask import Flask, jsonify, request, abort, redirect, url_for
+from hasher import HASH_POOL, PoolSaturated
 
 
 app = Flask(__name__)
@@ -17,6 +18,31 @@ def index():
     return jsonify({"message": "Bienvenue"})
 
 
+@app.teardown_appcontext
+def remove_db_session(exception=None):
+    """ release the database session of the request
+    """
+    AUTH._db.remove_session()
+
+
+@app.route('/stats', methods=['GET'], strict_slashes=False)
+def stats():
+    """ queue depth and latency of the password hashing pool, hits
+        and misses of the session cache
+    """
+    return jsonify({"hash_pool": HASH_POOL.stats(),
+                    "session_cache": AUTH._sessions.stats()})
+
+
+@app.errorhandler(PoolSaturated)
+def hash_pool_saturated(error):
+    """ too many passwords waiting to be hashed: ask to retry later
+    """
+    response = jsonify({"message": "service busy, retry later"})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 503
+
+
 @app.route('/users', methods=['POST'], strict_slashes=False)
 def users():
     """ register users
@@ -55,8 +81,8 @@ def logout():
         session_id = request.cookies.get('session_id')
         if not session_id:
             abort(403)
-        user = AUTH._db.find_user_by(session_id=session_id)
-        AUTH.destroy_session(user.id)
+        if not AUTH.destroy_session_by_session_id(session_id):
+            abort(403)
         return redirect('/')
     except Exception:
         abort(403)
@@ -70,13 +96,15 @@ def profile():
         session_id = request.cookies.get('session_id')
         if not session_id:
             abort(403)
-        user = AUTH._db.find_user_by(session_id=session_id)
-        return jsonify({"email": user.email}), 200
+        user = AUTH.get_session_user(session_id)
+        if user is None:
+            abort(403)
+        return jsonify({"email": user[1]}), 200
     except Exception:
         abort(403)
 
 
-@app.route('/reset_password', methods=['POST', 'PUT'], strict_slashes=False)
+@app.route('/reset_password', methods=['POST'], strict_slashes=False)
 def get_reset_password_token():
     """ get reset password token
     """
@@ -88,7 +116,7 @@ def get_reset_password_token():
         abort(403)
 
 
-@app.route("/reset_password", methods=["PUT"])
+@app.route("/reset_password", methods=["PUT"], strict_slashes=False)
 def update_password():
     """ Update password
     """
@@ -101,6 +129,8 @@ def update_password():
         AUTH.update_password(reset_token, new_password)
         return jsonify({"email": email,
                         "message": "Password updated"}), 200
+    except PoolSaturated:
+        raise
     except Exception:
         abort(403)
 
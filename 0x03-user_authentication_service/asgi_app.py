@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+""" ASGI App Module: the routes of app.py for an asyncio server
+
+    $ uvicorn asgi_app:app --port 5000
+
+The event loop only parses requests and writes responses: database
+calls run on a bounded thread pool (ASGI_DB_THREADS) with one session
+per thread, bcrypt runs on the hashing pool and is awaited by the event
+loop (no thread waits for it), so a process can keep thousands of idle
+keep-alive connections open.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from typing import Callable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from auth import Auth
+from hasher import HASH_POOL, PoolSaturated
+from session_cache import SessionCache
+
+
+# production mode: each executor thread needs its own session
+AUTH = Auth(production=True)
+DB_EXECUTOR = ThreadPoolExecutor(int(os.getenv('ASGI_DB_THREADS', 16)),
+                                 thread_name_prefix="asgi-db")
+MAX_BODY = 64 * 1024
+
+
+class Response:
+    """ status, JSON body and extra headers of a response
+    """
+
+    def __init__(self, status: int, body: Optional[dict] = None,
+                 headers: Optional[List[Tuple[str, str]]] = None):
+        """ init a response
+        """
+        self.status = status
+        self.body = body
+        self.headers = headers or []
+
+
+def _run_db(fn: Callable, *args):
+    """ call fn on an executor thread, then release its session
+    """
+    try:
+        return fn(*args)
+    finally:
+        AUTH._db.remove_session()
+
+
+def session_user(session_id: str) -> Optional[Tuple[int, str]]:
+    """ (id, email) of the user of a session, cached once found
+    """
+    if not isinstance(AUTH._sessions, SessionCache):
+        # shared cache process: only queried from the executor threads
+        return AUTH.get_session_user(session_id)
+    user = AUTH.get_user_from_session_id(session_id)
+    if user is None:
+        return None
+    return user.id, user.email
+
+
+async def db(fn: Callable, *args):
+    """ await fn(*args) run on the database threads
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DB_EXECUTOR, _run_db, fn, *args)
+
+
+async def hashing(submit: Callable, *args):
+    """ await submit(*args) (HASH_POOL.submit_hash or submit_check),
+        PoolSaturated if it takes more than the timeout of the pool
+    """
+    if HASH_POOL.workers <= 0:
+        # bcrypt on the calling thread: not on the event loop
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(None, submit, *args)
+        return future.result()
+    future = asyncio.wrap_future(submit(*args))
+    try:
+        return await asyncio.wait_for(future, HASH_POOL.timeout)
+    except asyncio.TimeoutError:
+        raise PoolSaturated(HASH_POOL.retry_after())
+
+
+async def index(form: dict, cookies: dict) -> Response:
+    """ simple index GET route
+    """
+    return Response(200, {"message": "Bienvenue"})
+
+
+async def stats(form: dict, cookies: dict) -> Response:
+    """ hashing pool and session cache counters
+    """
+    return Response(200, {"hash_pool": HASH_POOL.stats(),
+                          "session_cache": AUTH._sessions.stats()})
+
+
+async def users(form: dict, cookies: dict) -> Response:
+    """ register users
+    """
+    email = form.get('email')
+    password = form.get('password')
+    try:
+        await db(AUTH._check_new_email, email)
+    except ValueError:
+        return Response(400, {"message": "email already registered"})
+    hashed_password = await hashing(HASH_POOL.submit_hash,
+                                    password.encode('utf-8'))
+    await db(AUTH._db.add_user, email, hashed_password)
+    return Response(200, {"email": f"{email}", "message": "user created"})
+
+
+async def valid_login(email: str, password: str) -> bool:
+    """ Auth.valid_login with bcrypt awaited on the event loop
+    """
+    found = await db(AUTH._password_of, email)
+    if found is None:
+        return False
+    user_id, user_password = found
+    password = password.encode('utf-8')
+    if not await hashing(HASH_POOL.submit_check, password, user_password):
+        return False
+    if HASH_POOL.needs_rehash(user_password):
+        # hashed with a lower cost: upgrade while we know the password
+        try:
+            hashed_password = await hashing(HASH_POOL.submit_hash, password)
+        except PoolSaturated:
+            return True
+        await db(AUTH._db.update_user, user_id,
+                 hashed_password=hashed_password)
+    return True
+
+
+async def login(form: dict, cookies: dict) -> Response:
+    """ login user and create a session for user
+    """
+    email = form.get('email')
+    password = form.get('password')
+    if not await valid_login(email, password):
+        return Response(401)
+    session_id = await db(AUTH.create_session, email)
+    return Response(200, {'email': email, 'message': "logged in"},
+                    [("set-cookie", "session_id={}; Path=/".format(
+                        session_id))])
+
+
+async def logout(form: dict, cookies: dict) -> Response:
+    """ logs a user out and destroys the session
+    """
+    session_id = cookies.get('session_id')
+    if not session_id \
+            or not await db(AUTH.destroy_session_by_session_id, session_id):
+        return Response(403)
+    return Response(302, None, [("location", "/")])
+
+
+async def profile(form: dict, cookies: dict) -> Response:
+    """ user profile, from the session cache when possible
+    """
+    session_id = cookies.get('session_id')
+    if not session_id:
+        return Response(403)
+    user = None
+    if isinstance(AUTH._sessions, SessionCache):
+        # no I/O: answered on the event loop
+        user = AUTH._sessions.get(session_id)
+    if user is None:
+        user = await db(session_user, session_id)
+    if user is None:
+        return Response(403)
+    return Response(200, {"email": user[1]})
+
+
+async def get_reset_password_token(form: dict, cookies: dict) -> Response:
+    """ get reset password token
+    """
+    email = form.get("email")
+    try:
+        reset_token = await db(AUTH.get_reset_password_token, email)
+    except ValueError:
+        return Response(403)
+    return Response(200, {"email": email, "reset_token": reset_token})
+
+
+async def update_password(form: dict, cookies: dict) -> Response:
+    """ update password
+    """
+    email = form.get("email")
+    reset_token = form.get("reset_token")
+    new_password = form.get("new_password")
+    if not email or not reset_token or not new_password:
+        return Response(403)
+    try:
+        # checked before hashing: an unknown token costs no bcrypt work
+        await db(AUTH._check_reset_token, reset_token)
+        hashed_password = await hashing(HASH_POOL.submit_hash,
+                                        new_password.encode('utf-8'))
+        await db(AUTH._set_password, reset_token, hashed_password)
+    except ValueError:
+        return Response(403)
+    return Response(200, {"email": email, "message": "Password updated"})
+
+
+ROUTES = {
+    ('GET', '/'): index,
+    ('GET', '/stats'): stats,
+    ('POST', '/users'): users,
+    ('POST', '/sessions'): login,
+    ('DELETE', '/sessions'): logout,
+    ('GET', '/profile'): profile,
+    ('POST', '/reset_password'): get_reset_password_token,
+    ('PUT', '/reset_password'): update_password,
+}
+
+
+async def read_form(receive: Callable) -> Optional[dict]:
+    """ url-encoded form of the request body, None if too large
+    """
+    chunks = []
+    size = 0
+    more_body = True
+    while more_body:
+        message = await receive()
+        chunk = message.get('body', b"")
+        size += len(chunk)
+        if size > MAX_BODY:
+            return None
+        chunks.append(chunk)
+        more_body = message.get('more_body', False)
+    return dict(parse_qsl(b"".join(chunks).decode('latin-1')))
+
+
+async def send_response(send: Callable, response: Response) -> None:
+    """ send a response as JSON
+    """
+    if response.body is not None:
+        body = json.dumps(response.body).encode('utf-8')
+        content_type = b"application/json"
+    else:
+        body = b""
+        content_type = b"text/plain"
+    headers = [(b"content-type", content_type),
+               (b"content-length", str(len(body)).encode())]
+    headers += [(k.encode(), v.encode()) for k, v in response.headers]
+    await send({'type': 'http.response.start', 'status': response.status,
+                'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive: Callable, send: Callable) -> None:
+    """ start and stop the executors with the server
+    """
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            DB_EXECUTOR.shutdown(wait=True)
+            HASH_POOL.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope: dict, receive: Callable, send: Callable) -> None:
+    """ ASGI entry point
+    """
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    path = scope['path'].rstrip('/') or '/'
+    route = ROUTES.get((scope['method'], path))
+    if route is None:
+        methods = [m for (m, p) in ROUTES if p == path]
+        await send_response(send, Response(405 if methods else 404))
+        return
+    form = await read_form(receive)
+    if form is None:
+        await send_response(send, Response(413))
+        return
+    cookies = {}
+    for name, value in scope.get('headers', []):
+        if name == b"cookie":
+            cookie = SimpleCookie()
+            cookie.load(value.decode('latin-1'))
+            cookies.update({k: m.value for k, m in cookie.items()})
+    try:
+        response = await route(form, cookies)
+    except PoolSaturated as error:
+        response = Response(503, {"message": "service busy, retry later"},
+                            [("retry-after", str(error.retry_after))])
+    await send_response(send, response)
@@ -2,53 +2,77 @@
 """ Auth module
 """
 
-import bcrypt
 import uuid
 from db import DB
+from hasher import HASH_POOL, PoolSaturated
+from session_cache import session_cache
 from sqlalchemy.exc import InvalidRequestError
 from sqlalchemy.orm.exc import NoResultFound
+from typing import Optional, Tuple
 from user import User
 
 
 def _hash_password(password: str) -> bytes:
-    """ hash user password
+    """ hash user password (on the hashing pool)
     """
-    salt = bcrypt.gensalt()
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-    return hashed_password
+    return HASH_POOL.hash_password(password.encode('utf-8'))
 
 
 class Auth:
     """Auth class to interact with the authentication database.
     """
 
-    def __init__(self):
-        """ init Database
+    def __init__(self, production: Optional[bool] = None):
+        """ init Database (see DB for production)
         """
-        self._db = DB()
+        self._db = DB(production)
+        self._sessions = session_cache()
 
     def register_user(self, email: str, password: str) -> User:
         """ register user and save to database
         """
+        self._check_new_email(email)
+        return self._db.add_user(email, _hash_password(password))
+
+    def _check_new_email(self, email: str) -> None:
+        """ ValueError if a user has this email
+        """
         try:
-            existing_user = self._db.find_user_by(email=email)
-            if existing_user:
-                raise ValueError(f"User {email} already exists")
+            self._db.find_user_by(email=email)
         except NoResultFound:
-            hashed_password = _hash_password(password)
-            new_user = self._db.add_user(email, hashed_password)
-            return new_user
+            return
+        raise ValueError(f"User {email} already exists")
 
     def valid_login(self, email: str, password: str) -> bool:
         """ validate user login details
         """
+        found = self._password_of(email)
+        if found is None:
+            return False
+        user_id, user_password = found
+        password = password.encode('utf-8')
+        if not HASH_POOL.check_password(password, user_password):
+            return False
+        if HASH_POOL.needs_rehash(user_password):
+            # hashed with a lower cost: upgrade while we know the password
+            try:
+                self._db.update_user(
+                    user_id, hashed_password=HASH_POOL.hash_password(password))
+            except PoolSaturated:
+                pass
+        return True
+
+    def _password_of(self, email: str) -> Optional[Tuple[int, bytes]]:
+        """ id and password hash of a user, None if there is none
+        """
         try:
             user = self._db.find_user_by(email=email)
-            hashed_password = password.encode('utf-8')
-            user_password = user.hashed_password
-            return bcrypt.checkpw(hashed_password, user_password)
         except (NoResultFound, InvalidRequestError):
-            return False
+            return None
+        user_password = user.hashed_password
+        if isinstance(user_password, str):
+            user_password = user_password.encode('utf-8')
+        return user.id, user_password
 
     def _generate_uuid(self) -> str:
         """ Generate UUID
@@ -58,13 +82,15 @@ class Auth:
     def create_session(self, email: str) -> str:
         """ creates a session for a user
         """
+        session_id = self._generate_uuid()
         try:
-            user = self._db.find_user_by(email=email)
-            session_id = self._generate_uuid()
-            self._db.update_user(user.id, session_id=session_id)
-            return session_id
+            user_id = self._db.update_user_by({'email': email},
+                                              session_id=session_id)
         except NoResultFound:
             return None
+        # the previous session of the user is gone
+        self._sessions.invalidate_user(user_id)
+        return session_id
 
     def get_user_from_session_id(self, session_id: str) -> User:
         """ get a user from a session id
@@ -73,26 +99,58 @@ class Auth:
             return None
         try:
             user = self._db.find_user_by(session_id=session_id)
-            return user
         except (NoResultFound, InvalidRequestError):
             return None
+        self._sessions.put(session_id, user.id, user.email)
+        return user
+
+    def get_session_user(self, session_id: str
+                         ) -> Optional[Tuple[int, str]]:
+        """ (id, email) of the user of a session, from the session cache
+            when possible
+        """
+        if session_id is None:
+            return None
+        cached = self._sessions.get(session_id)
+        if cached is not None:
+            return tuple(cached)
+        user = self.get_user_from_session_id(session_id)
+        if user is None:
+            return None
+        return user.id, user.email
 
     def destroy_session(self, user_id: int) -> None:
         """ destroys a user session
         """
+        if user_id is None:
+            return None
         try:
-            user = self._db.find_user_by(id=user_id)
-            self._db.update_user(user.id, session_id=None)
+            self._db.update_user_by({'id': user_id}, session_id=None)
         except NoResultFound:
             return None
+        finally:
+            self._sessions.invalidate_user(user_id)
+
+    def destroy_session_by_session_id(self, session_id: str) -> bool:
+        """ destroys a session from its id, False if there is none
+        """
+        if session_id is None:
+            return False
+        self._sessions.invalidate(session_id)
+        try:
+            user_id = self._db.update_user_by({'session_id': session_id},
+                                              session_id=None)
+        except NoResultFound:
+            return False
+        self._sessions.invalidate_user(user_id)
+        return True
 
     def get_reset_password_token(self, email: str) -> str:
         """ generate a token to reset password
         """
+        token = self._generate_uuid()
         try:
-            user = self._db.find_user_by(email=email)
-            token = self._generate_uuid()
-            self._db.update_user(user.id, reset_token=token)
+            self._db.update_user_by({'email': email}, reset_token=token)
             return token
         except Exception:
             raise ValueError()
@@ -100,10 +158,28 @@ class Auth:
     def update_password(self, reset_token: str, password: str):
         """ updates my password babyyyyyy
         """
+        # checked before hashing: an unknown token costs no bcrypt work
+        self._check_reset_token(reset_token)
+        self._set_password(reset_token, _hash_password(password))
+
+    def _check_reset_token(self, reset_token: str) -> None:
+        """ ValueError unless a user has this reset token (unique index)
+        """
+        if reset_token is None:
+            raise ValueError()
+        try:
+            self._db.find_user_by(reset_token=reset_token)
+        except (NoResultFound, InvalidRequestError):
+            raise ValueError()
+
+    def _set_password(self, reset_token: str, hashed_password: bytes):
+        """ set the password hash of the user of a reset token and consume
+            the token, ValueError if it was consumed meanwhile
+        """
         try:
-            user = self._db.find_user_by(reset_token=reset_token)
-            hashed_password = _hash_password(password)
-            self._db.update_user(user.id, hashed_password=hashed_password,
-                                 reset_token=None)
+            user_id = self._db.update_user_by({'reset_token': reset_token},
+                                              hashed_password=hashed_password,
+                                              reset_token=None)
         except (NoResultFound, ValueError):
             raise ValueError()
+        self._sessions.invalidate_user(user_id)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+""" Benchmark of the /profile lookup (DB.find_user_by(session_id=...))
+with and without the session_id index
+
+Usage: python3 bench_profile.py [number of users ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+from sqlalchemy import insert
+
+
+def bench(count: int, lookups: int = 200) -> tuple:
+    """ seconds per lookup with the index, then without it, for a
+        table of count users
+    """
+    from db import DB
+    from user import User
+
+    sampled = set(random.sample(range(count), min(lookups, count)))
+    session_ids = []
+    db = DB()
+    batch = []
+    for i in range(count):
+        session_id = str(uuid.uuid4())
+        if i in sampled:
+            session_ids.append(session_id)
+        batch.append({"email": "user{}@example.com".format(i),
+                      "hashed_password": "x", "session_id": session_id})
+        if len(batch) == 50000 or i == count - 1:
+            db._session.execute(insert(User), batch)
+            batch = []
+    db._session.commit()
+
+    timings = []
+    for indexed in (True, False):
+        if not indexed:
+            for index in User.__table__.indexes:
+                if index.name == "ix_users_session_id":
+                    index.drop(db._engine)
+        db.remove_session()
+        start = time.perf_counter()
+        for session_id in session_ids:
+            db.find_user_by(session_id=session_id)
+        timings.append((time.perf_counter() - start) / len(session_ids))
+    db._engine.dispose()
+    return tuple(timings)
+
+
+def main():
+    """ run the benchmark on a temporary SQLite file per size
+    """
+    counts = [int(c) for c in sys.argv[1:]] or [10000, 100000, 1000000]
+    for count in counts:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['AUTH_DB_MODE'] = "production"
+            os.environ['AUTH_DB_URL'] = "sqlite:///{}".format(
+                os.path.join(tmp, "bench.db"))
+            indexed, scan = bench(count)
+        print("{:>8} users  indexed: {:>8.1f} us/lookup  scan: {:>10.1f} "
+              "us/lookup  speedup: x{:.0f}".format(
+                  count, indexed * 1e6, scan * 1e6, scan / indexed))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,103 @@
 #!/usr/bin/env python3
 """DB module
 """
-from sqlalchemy import create_engine
+import os
+
+from typing import List, Optional
+
+from sqlalchemy import create_engine, event, select, update
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.exc import InvalidRequestError
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.orm.exc import NoResultFound
 from sqlalchemy.orm.session import Session
+from sqlalchemy.pool import StaticPool
 
 from user import Base, User
 
 
+def production_engine(url: str) -> Engine:
+    """ engine with an explicitly sized pool: AUTH_DB_POOL_SIZE,
+        AUTH_DB_MAX_OVERFLOW and AUTH_DB_POOL_TIMEOUT (seconds);
+        SQLite files use WAL and wait AUTH_DB_BUSY_TIMEOUT ms for locks
+    """
+    busy_timeout = int(os.getenv('AUTH_DB_BUSY_TIMEOUT', 5000))
+    kwargs = {}
+    sqlite = url.startswith("sqlite")
+    if sqlite:
+        kwargs['connect_args'] = {'check_same_thread': False,
+                                  'timeout': busy_timeout / 1000}
+    if sqlite and make_url(url).database in (None, "", ":memory:"):
+        # in-memory SQLite: a database per connection, so all the
+        # threads share a single one
+        kwargs['poolclass'] = StaticPool
+    else:
+        kwargs['pool_size'] = int(os.getenv('AUTH_DB_POOL_SIZE', 10))
+        kwargs['max_overflow'] = int(os.getenv('AUTH_DB_MAX_OVERFLOW', 10))
+        kwargs['pool_timeout'] = float(os.getenv('AUTH_DB_POOL_TIMEOUT',
+                                                 30))
+        kwargs['pool_pre_ping'] = True
+    engine = create_engine(url, echo=False, **kwargs)
+    if sqlite:
+        @event.listens_for(engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            """ readers do not block the writer, writers wait for locks
+            """
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA busy_timeout={:d}".format(busy_timeout))
+            cursor.close()
+    return engine
+
+
 class DB:
     """DB class
     """
 
-    def __init__(self) -> None:
+    def __init__(self, production: Optional[bool] = None) -> None:
         """Initialize a new DB instance
+        In production mode (AUTH_DB_MODE=production unless production is
+        given), the schema of AUTH_DB_URL is kept across restarts and each
+        thread (request) gets its own session
         """
-        self._engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self._engine)
+        url = os.getenv('AUTH_DB_URL', "sqlite:///a.db")
+        if production is None:
+            production = os.getenv('AUTH_DB_MODE') == "production"
+        self.production = production
+        if self.production:
+            self._engine = production_engine(url)
+            self.__scoped = scoped_session(sessionmaker(bind=self._engine))
+        else:
+            self._engine = create_engine(url, echo=False)
+            Base.metadata.drop_all(self._engine)
+            self.__scoped = None
         Base.metadata.create_all(self._engine)
+        # create_all skips existing tables: add the indexes missing from
+        # a database created by a previous version
+        for index in User.__table__.indexes:
+            index.create(self._engine, checkfirst=True)
         self.__session = None
 
     @property
     def _session(self) -> Session:
-        """Memoized session object
+        """Memoized session object (session of the current thread in
+        production mode)
         """
+        if self.__scoped is not None:
+            return self.__scoped()
         if self.__session is None:
             DBSession = sessionmaker(bind=self._engine)
             self.__session = DBSession()
         return self.__session
 
+    def remove_session(self) -> None:
+        """ end the session of the current request (production mode)
+        """
+        if self.__scoped is not None:
+            self.__scoped.remove()
+
     def add_user(self, email: str, hashed_password: str) -> User:
         """ add user to database
         """
@@ -43,7 +109,14 @@ class DB:
     def find_user_by(self, **kwargs) -> User:
         """ find user by attributes in kwargs
         """
+        if list(kwargs) == ['id']:
+            # primary key: identity map, else a point query
+            user = self._session.get(User, kwargs['id'])
+            if user is None:
+                raise NoResultFound()
+            return user
         try:
+            # email, session_id and reset_token are unique indexes
             user = self._session.query(User).filter_by(**kwargs).one()
         except NoResultFound:
             raise NoResultFound()
@@ -54,11 +127,53 @@ class DB:
     def update_user(self, user_id: int, **kwargs) -> None:
         """ updates the details of a user
         """
-        user = self.find_user_by(id=user_id)
-        if not user:
+        self.update_user_by({'id': user_id}, **kwargs)
+
+    def update_user_by(self, where: dict, **kwargs) -> int:
+        """ updates the user matching all the attributes of where in a
+            single UPDATE, returns its id
+        """
+        ids = self.update_users_by(where, **kwargs)
+        if not ids:
             raise NoResultFound()
-        for k, v in kwargs.items():
-            if not hasattr(user, k):
+        return ids[0]
+
+    def update_users_by(self, where: dict, **kwargs) -> List[int]:
+        """ updates all the users matching where (a list or a tuple
+            value matches any of its items) in a single
+            UPDATE ... RETURNING and one commit, returns their ids;
+            ValueError if where is empty or has a None value: it would
+            update every user, or all the ones without a session
+        """
+        columns = User.__table__.columns
+        for k in kwargs:
+            if k not in columns:
+                raise ValueError()
+        if not where:
+            raise ValueError()
+        conditions = []
+        for k, v in where.items():
+            if k not in columns:
+                raise InvalidRequestError()
+            values = v if isinstance(v, (list, tuple)) else [v]
+            if any(value is None for value in values):
                 raise ValueError()
-            setattr(user, k, v)
-        self.__session.commit()
+            if isinstance(v, (list, tuple)):
+                conditions.append(columns[k].in_(v))
+            else:
+                conditions.append(columns[k] == v)
+        statement = update(User).where(*conditions).values(**kwargs)
+        if self._engine.dialect.update_returning:
+            result = self._session.execute(statement.returning(User.id))
+            ids = [row[0] for row in result]
+        else:
+            # no RETURNING (SQLite < 3.35): select the ids in the same
+            # transaction, then update these rows if they still match
+            ids = list(self._session.execute(
+                select(User.id).where(*conditions)).scalars())
+            result = self._session.execute(
+                statement.where(User.id.in_(ids))) if ids else None
+            if result is None or result.rowcount == 0:
+                ids = []
+        self._session.commit()
+        return ids
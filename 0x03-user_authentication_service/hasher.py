@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+""" Hasher module: bcrypt work on a bounded pool of processes
+"""
+
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from threading import BoundedSemaphore, Lock
+import bcrypt
+import os
+import time
+
+
+class PoolSaturated(Exception):
+    """ Raised when the hashing queue is full
+    """
+
+    def __init__(self, retry_after: int):
+        """ init with the delay to suggest to the client
+        """
+        super().__init__("password hashing queue is full")
+        self.retry_after = retry_after
+
+
+def calibrate_rounds(target_ms: float, min_rounds: int = 10,
+                     max_rounds: int = 16) -> int:
+    """ highest bcrypt cost whose hash takes at most target_ms on this
+        machine, within [min_rounds, max_rounds]
+    """
+    # each round doubles the work: time a cheap cost and extrapolate
+    probe = 6
+    salt = bcrypt.gensalt(probe)
+    elapsed = float('inf')
+    for _ in range(3):
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", salt)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    rounds = min_rounds
+    while rounds < max_rounds \
+            and elapsed * 1000 * 2 ** (rounds + 1 - probe) <= target_ms:
+        rounds += 1
+    return rounds
+
+
+def hash_rounds(hashed_password: bytes) -> int:
+    """ cost of a bcrypt hash
+    """
+    # $2b$<cost>$<salt and hash>
+    return int(hashed_password.split(b"$")[2])
+
+
+def _hashpw(password: bytes, salt: bytes) -> bytes:
+    """ bcrypt.hashpw in a worker process
+    """
+    return bcrypt.hashpw(password, salt)
+
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    """ bcrypt.checkpw in a worker process
+    """
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class HashPool:
+    """ Runs bcrypt on `workers` processes with at most `queue_size`
+        calls waiting: beyond that, calls fail fast with PoolSaturated
+        so password work cannot pile up behind cheap requests
+    """
+
+    def __init__(self, workers: int, queue_size: int, timeout: float,
+                 rounds: int = 12):
+        """ init the pool, processes are started on first use
+        """
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._executor = None
+        self._slots = BoundedSemaphore(max(workers, 1) + queue_size)
+        self._lock = Lock()
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """ executor of the pool, created in the process using it
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.workers)
+            return self._executor
+
+    def _submit(self, fn, *args) -> Future:
+        """ start fn on the pool, its slot is released when it ends
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise PoolSaturated(self.retry_after())
+        with self._lock:
+            self._in_flight += 1
+        start = time.monotonic()
+
+        def done(future: Future):
+            latency = time.monotonic() - start
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+            self._slots.release()
+
+        if self.workers <= 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as error:
+                future.set_exception(error)
+        else:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except Exception:
+                done(None)
+                raise
+        future.add_done_callback(done)
+        return future
+
+    def _run(self, fn, *args):
+        """ run fn on the pool and wait for its result
+        """
+        future = self._submit(fn, *args)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            # the call keeps its slot until it ends: the queue is full
+            raise PoolSaturated(self.retry_after())
+
+    def hash_password(self, password: bytes) -> bytes:
+        """ salted bcrypt hash of a password
+        """
+        return self._run(_hashpw, password, bcrypt.gensalt(self.rounds))
+
+    def check_password(self, password: bytes,
+                       hashed_password: bytes) -> bool:
+        """ check a password against its bcrypt hash
+        """
+        return self._run(_checkpw, password, hashed_password)
+
+    def submit_hash(self, password: bytes) -> Future:
+        """ hash_password without waiting: a future of the hash
+        """
+        return self._submit(_hashpw, password, bcrypt.gensalt(self.rounds))
+
+    def submit_check(self, password: bytes,
+                     hashed_password: bytes) -> Future:
+        """ check_password without waiting: a future of the result
+        """
+        return self._submit(_checkpw, password, hashed_password)
+
+    def needs_rehash(self, hashed_password: bytes) -> bool:
+        """ whether a hash was made with a lower cost than the pool's: a
+            host calibrating a lower cost never downgrades stronger hashes
+        """
+        return hash_rounds(hashed_password) < self.rounds
+
+    def shutdown(self) -> None:
+        """ stop the worker processes once the calls in progress end
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def retry_after(self) -> int:
+        """ seconds for the current queue to drain, at least 1
+        """
+        with self._lock:
+            if self._completed == 0:
+                return 1
+            average = self._latency_total / self._completed
+            waiting = self._in_flight / max(self.workers, 1)
+        return max(1, int(average * waiting + 0.999))
+
+    def stats(self) -> dict:
+        """ queue depth and latency of the pool
+        """
+        with self._lock:
+            average = self._latency_total / self._completed \
+                if self._completed else 0.0
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "in_flight": self._in_flight,
+                "queued": max(0, self._in_flight - max(self.workers, 1)),
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "latency_avg_ms": round(average * 1000, 3),
+                "latency_max_ms": round(self._latency_max * 1000, 3),
+            }
+
+
+def hash_pool() -> HashPool:
+    """ pool configured by HASH_POOL_WORKERS (0 hashes on the calling
+        thread), HASH_POOL_QUEUE and HASH_POOL_TIMEOUT (seconds); the
+        bcrypt cost is BCRYPT_ROUNDS if set, else calibrated at startup
+        for a hash to take BCRYPT_TARGET_MS (default 250)
+    """
+    try:
+        workers = int(os.getenv('HASH_POOL_WORKERS', os.cpu_count() or 1))
+    except ValueError:
+        workers = os.cpu_count() or 1
+    try:
+        queue_size = int(os.getenv('HASH_POOL_QUEUE', 2 * max(workers, 1)))
+    except ValueError:
+        queue_size = 2 * max(workers, 1)
+    try:
+        timeout = float(os.getenv('HASH_POOL_TIMEOUT', 30))
+    except ValueError:
+        timeout = 30.0
+    if os.getenv('BCRYPT_ROUNDS'):
+        rounds = int(os.getenv('BCRYPT_ROUNDS'))
+    else:
+        rounds = calibrate_rounds(float(os.getenv('BCRYPT_TARGET_MS', 250)))
+    return HashPool(workers, queue_size, timeout, rounds)
+
+
+HASH_POOL = hash_pool()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+""" Load test of GET /profile with many concurrent keep-alive clients
+
+    $ python3 app.py                                   # Flask
+    $ uvicorn asgi_app:app --port 5000                 # ASGI
+    $ python3 loadtest.py --clients 500 --duration 10
+
+Each client logs in once, then requests its profile in a loop on its
+own connection (reopened when the server closes it); throughput and
+latency percentiles are printed at the end.
+"""
+import argparse
+import asyncio
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import urlencode, urlparse
+
+
+class Client:
+    """ HTTP/1.1 client on one connection
+    """
+
+    def __init__(self, host: str, port: int):
+        """ init a client, the connection is opened on first request
+        """
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.cookie = None
+
+    async def request(self, method: str, path: str,
+                      form: Optional[dict] = None) -> Tuple[int, dict]:
+        """ status and headers of a response, its body is skipped
+        """
+        body = urlencode(form).encode() if form else b""
+        lines = ["{} {} HTTP/1.1".format(method, path),
+                 "Host: {}:{}".format(self.host, self.port),
+                 "Content-Length: {}".format(len(body))]
+        if form:
+            lines.append("Content-Type: application/x-www-form-urlencoded")
+        if self.cookie:
+            lines.append("Cookie: session_id={}".format(self.cookie))
+        data = ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+        for attempt in (1, 2):
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_connection(
+                    self.host, self.port)
+            try:
+                self.writer.write(data)
+                return await self._read_response()
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # closed by the server between two requests
+                self.close()
+                if attempt == 2:
+                    raise
+
+    async def _read_response(self) -> Tuple[int, dict]:
+        """ read a response, close the connection if the server asks to
+        """
+        status_line = await self.reader.readuntil(b"\r\n")
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, value = line.decode('latin-1').split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+        if 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        else:
+            await self.reader.read()
+            self.close()
+        if headers.get('connection', '').lower() == 'close' \
+                or version == b"HTTP/1.0" and self.writer is not None \
+                and headers.get('connection', '').lower() != 'keep-alive':
+            self.close()
+        cookie = headers.get('set-cookie', '')
+        if cookie.startswith("session_id="):
+            self.cookie = cookie.split(";")[0].split("=", 1)[1]
+        return int(status), headers
+
+    def close(self):
+        """ close the connection
+        """
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+async def run_client(client: Client, email: str, password: str,
+                     deadline: float, latencies: List[float],
+                     errors: List[int]) -> None:
+    """ log in, then request the profile until deadline
+    """
+    form = {'email': email, 'password': password}
+    status, headers = await client.request('POST', '/sessions', form)
+    while status == 503 and time.monotonic() < deadline:
+        # hashing queue full: come back as told
+        await asyncio.sleep(float(headers.get('retry-after', 1)))
+        status, headers = await client.request('POST', '/sessions', form)
+    if status != 200:
+        errors.append(status)
+        return
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            status, _ = await client.request('GET', '/profile')
+        except (OSError, asyncio.IncompleteReadError):
+            errors.append(0)
+            continue
+        latencies.append(time.perf_counter() - start)
+        if status != 200:
+            errors.append(status)
+    client.close()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """ value below which fraction of the sorted values are
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main():
+    """ register the users, run the clients, print the results
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+    url = urlparse(args.url)
+    host, port = url.hostname, url.port or 80
+
+    password = "loadtest"
+    # a user has one session: a client per account
+    emails = ["loadtest{}@example.com".format(i)
+              for i in range(args.clients)]
+    setup = Client(host, port)
+    for email in emails:
+        await setup.request('POST', '/users',
+                            {'email': email, 'password': password})
+    setup.close()
+
+    latencies = []
+    errors = []
+    # logins are CPU bound: do not count them in the measure
+    clients = [Client(host, port) for _ in range(args.clients)]
+    deadline = time.monotonic() + args.duration
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(client, email, password, deadline, latencies, errors)
+        for client, email in zip(clients, emails)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print("{} clients, {} requests in {:.1f}s: {:.0f} req/s".format(
+        args.clients, len(latencies), elapsed, len(latencies) / elapsed))
+    if errors:
+        print("errors: {}".format(", ".join(
+            "{} x {}".format(errors.count(status), status or "connection")
+            for status in sorted(set(errors)))))
+    print("latency p50 {:.1f} ms  p99 {:.1f} ms  max {:.1f} ms".format(
+        percentile(latencies, 0.50) * 1000,
+        percentile(latencies, 0.99) * 1000,
+        percentile(latencies, 1.0) * 1000))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
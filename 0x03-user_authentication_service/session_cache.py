@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+""" Session cache module: session_id -> (user id, email) read-through
+cache, so that authenticated reads do not query the database
+
+The cache lives in the process, or with SESSION_CACHE_ADDRESS
+([host:]port, host 127.0.0.1 by default) in a cache process shared by
+all the workers of a host, started with: python3 session_cache.py serve
+The shared cache and its clients authenticate with SESSION_CACHE_AUTHKEY,
+which must be set: the connections carry pickles.
+
+A logout or a password reset invalidates the cache of the worker that
+serves it, and the shared cache. The cache of another worker only forgets
+the session when its entry expires, up to SESSION_CACHE_TTL seconds later
+(5 by default in the process). So the cache in the process is only on by
+default with a single worker (WEB_CONCURRENCY unset or 1): with several
+workers, share the cache, or accept that delay with SESSION_CACHE_SIZE.
+"""
+from collections import OrderedDict
+from multiprocessing.managers import BaseManager
+from threading import Lock
+from typing import Optional, Tuple
+import os
+import sys
+import time
+
+
+class SessionCache:
+    """ Bounded LRU cache with TTL of the users of the sessions
+    """
+
+    def __init__(self, size: int = 10000, ttl: float = 60):
+        """ init a cache of size entries living ttl seconds
+        """
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._sessions_by_user = {}
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, session_id: str) -> Optional[Tuple[int, str]]:
+        """ (user id, email) of a cached session, None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    self._drop(session_id)
+                self._misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self._hits += 1
+            return entry[0], entry[1]
+
+    def put(self, session_id: str, user_id: int, email: str) -> None:
+        """ cache the user of a session
+        """
+        if self.size <= 0:
+            return
+        with self._lock:
+            self._drop(session_id)
+            self._entries[session_id] = (user_id, email,
+                                         time.monotonic() + self.ttl)
+            self._sessions_by_user.setdefault(user_id, set()).add(session_id)
+            while len(self._entries) > self.size:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, session_id: str) -> None:
+        """ remove an entry (the lock must be held)
+        """
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            sessions = self._sessions_by_user.get(entry[0])
+            sessions.discard(session_id)
+            if not sessions:
+                del self._sessions_by_user[entry[0]]
+
+    def invalidate(self, session_id: str) -> None:
+        """ forget a session
+        """
+        with self._lock:
+            self._drop(session_id)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """ forget all the sessions of a user
+        """
+        with self._lock:
+            for session_id in list(self._sessions_by_user.get(user_id, ())):
+                self._drop(session_id)
+
+    def stats(self) -> dict:
+        """ hit/miss counters and size of the cache
+        """
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.size,
+                    "hits": self._hits, "misses": self._misses}
+
+
+class CacheManager(BaseManager):
+    """ Serves a SessionCache to the workers of the host
+    """
+
+
+def cache_address() -> Tuple[str, int]:
+    """ address of the shared cache process, on the loopback interface
+        unless a host is given
+    """
+    host, _, port = os.getenv('SESSION_CACHE_ADDRESS').rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def cache_authkey() -> bytes:
+    """ key shared by the cache process and its clients, RuntimeError if
+        SESSION_CACHE_AUTHKEY is not set
+    """
+    authkey = os.getenv('SESSION_CACHE_AUTHKEY')
+    if not authkey:
+        raise RuntimeError("SESSION_CACHE_AUTHKEY must be set to use the "
+                           "shared session cache")
+    return authkey.encode()
+
+
+def session_cache() -> SessionCache:
+    """ cache configured by SESSION_CACHE_SIZE (0 disables it, the
+        default with WEB_CONCURRENCY > 1 workers) and SESSION_CACHE_TTL
+        (seconds, short: other workers do not see the logouts), or a
+        proxy to the shared cache process when SESSION_CACHE_ADDRESS is
+        set
+    """
+    if os.getenv('SESSION_CACHE_ADDRESS'):
+        CacheManager.register('cache')
+        manager = CacheManager(cache_address(), cache_authkey())
+        manager.connect()
+        return manager.cache()
+    # other workers would accept a logged out session until it expires
+    single_worker = int(os.getenv('WEB_CONCURRENCY', 1)) <= 1
+    return SessionCache(int(os.getenv('SESSION_CACHE_SIZE',
+                                      10000 if single_worker else 0)),
+                        float(os.getenv('SESSION_CACHE_TTL', 5)))
+
+
+def serve() -> None:
+    """ run the shared cache process
+    """
+    cache = SessionCache(int(os.getenv('SESSION_CACHE_SIZE', 100000)),
+                         float(os.getenv('SESSION_CACHE_TTL', 60)))
+    CacheManager.register('cache', callable=lambda: cache)
+    manager = CacheManager(cache_address(), cache_authkey())
+    manager.get_server().serve_forever()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["serve"] or not os.getenv('SESSION_CACHE_ADDRESS') \
+            or not os.getenv('SESSION_CACHE_AUTHKEY'):
+        sys.exit("Usage: SESSION_CACHE_ADDRESS=[host:]port "
+                 "SESSION_CACHE_AUTHKEY=secret python3 session_cache.py serve")
+    serve()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+""" Tests of the routes of the Flask app
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# cheap hashes on the calling thread, a throw-away database
+os.environ['BCRYPT_ROUNDS'] = '4'
+os.environ['HASH_POOL_WORKERS'] = '0'
+os.environ['AUTH_DB_URL'] = 'sqlite://'
+os.environ.pop('AUTH_DB_MODE', None)
+os.environ.pop('SESSION_CACHE_ADDRESS', None)
+
+import app as app_module  # noqa: E402
+from auth import Auth  # noqa: E402
+from hasher import HASH_POOL, PoolSaturated  # noqa: E402
+
+
+class AppTest(unittest.TestCase):
+    """ Flask routes on an empty database
+    """
+
+    def setUp(self):
+        """ A new database for each test
+        """
+        patcher = mock.patch.object(app_module, 'AUTH', Auth())
+        self.auth = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = app_module.app.test_client()
+
+    def register(self, email: str = "bob@example.com",
+                 password: str = "secret"):
+        """ POST /users
+        """
+        return self.client.post("/users", data={"email": email,
+                                                "password": password})
+
+    def login(self, email: str = "bob@example.com",
+              password: str = "secret"):
+        """ POST /sessions
+        """
+        return self.client.post("/sessions", data={"email": email,
+                                                   "password": password})
+
+    def test_register_login_logout(self):
+        """ The session of a login gives the profile until logout
+        """
+        self.assertEqual(self.register().status_code, 200)
+        self.assertEqual(self.register().status_code, 400)
+        self.assertEqual(self.login(password="wrong").status_code, 401)
+        self.assertEqual(self.login().status_code, 200)
+        profile = self.client.get("/profile")
+        self.assertEqual(profile.get_json(), {"email": "bob@example.com"})
+        self.assertEqual(self.client.delete("/sessions").status_code, 302)
+        self.assertEqual(self.client.get("/profile").status_code, 403)
+
+    def test_reset_password(self):
+        """ PUT /reset_password updates the password with a valid token
+        """
+        self.register()
+        token = self.client.post("/reset_password", data={
+            "email": "bob@example.com"}).get_json()["reset_token"]
+        form = {"email": "bob@example.com", "reset_token": "bad",
+                "new_password": "changed"}
+        self.assertEqual(self.client.put("/reset_password",
+                                         data=form).status_code, 403)
+        form["reset_token"] = token
+        response = self.client.put("/reset_password", data=form)
+        self.assertEqual(response.get_json(), {"email": "bob@example.com",
+                                               "message": "Password updated"})
+        self.assertEqual(self.login(password="secret").status_code, 401)
+        self.assertEqual(self.login(password="changed").status_code, 200)
+        self.assertEqual(self.client.put("/reset_password",
+                                         data=form).status_code, 403)
+
+    def test_pool_saturated(self):
+        """ A full hashing queue answers 503 with Retry-After
+        """
+        self.register()
+        token = self.client.post("/reset_password", data={
+            "email": "bob@example.com"}).get_json()["reset_token"]
+        with mock.patch.object(HASH_POOL, 'hash_password',
+                               side_effect=PoolSaturated(7)):
+            response = self.register("alice@example.com")
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["Retry-After"], "7")
+            response = self.client.put("/reset_password", data={
+                "email": "bob@example.com", "reset_token": token,
+                "new_password": "changed"})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.headers["Retry-After"], "7")
+
+
+if __name__ == "__main__":
+    unittest.main()
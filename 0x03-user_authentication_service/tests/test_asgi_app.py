@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+""" Smoke tests of the ASGI app, driven without a server
+"""
+import asyncio
+import json
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from unittest import mock
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# cheap hashes on the calling thread, a throw-away database
+os.environ['BCRYPT_ROUNDS'] = '4'
+os.environ['HASH_POOL_WORKERS'] = '0'
+os.environ['AUTH_DB_URL'] = 'sqlite://'
+os.environ.pop('AUTH_DB_MODE', None)
+os.environ.pop('SESSION_CACHE_ADDRESS', None)
+
+import asgi_app  # noqa: E402
+from auth import Auth  # noqa: E402
+from hasher import HashPool  # noqa: E402
+
+
+class AsgiAppTest(unittest.IsolatedAsyncioTestCase):
+    """ Requests sent to asgi_app.app on an empty database
+    """
+
+    def setUp(self):
+        """ A new database for each test
+        """
+        auth = Auth(production=True)
+        self.addCleanup(auth._db._engine.dispose)
+        patcher = mock.patch.object(asgi_app, 'AUTH', auth)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cookies = {}
+
+    async def request(self, method: str, path: str,
+                      form: Optional[dict] = None) -> tuple:
+        """ status, headers and decoded body of a request, the cookies
+            it sets are sent with the next ones
+        """
+        body = urlencode(form or {}).encode()
+        chunks = [{'type': 'http.request', 'body': body[:5],
+                   'more_body': True},
+                  {'type': 'http.request', 'body': body[5:]}]
+        headers = [(b"content-type", b"application/x-www-form-urlencoded")]
+        if self.cookies:
+            headers.append((b"cookie", "; ".join(
+                "{}={}".format(*item) for item in self.cookies.items()
+            ).encode()))
+        scope = {'type': 'http', 'method': method, 'path': path,
+                 'headers': headers}
+        sent = []
+
+        async def receive():
+            return chunks.pop(0)
+
+        async def send(message):
+            sent.append(message)
+        await asgi_app.app(scope, receive, send)
+        self.assertEqual([m['type'] for m in sent],
+                         ['http.response.start', 'http.response.body'])
+        headers = {k.decode(): v.decode() for k, v in sent[0]['headers']}
+        if 'set-cookie' in headers:
+            name, _, value = headers['set-cookie'].split(";")[0].partition(
+                "=")
+            self.cookies[name] = value
+        body = sent[1]['body']
+        self.assertEqual(headers['content-length'], str(len(body)))
+        return sent[0]['status'], headers, json.loads(body) if body else None
+
+    async def test_flow(self):
+        """ register, login, profile, reset password and logout
+        """
+        status, _, body = await self.request('GET', '/')
+        self.assertEqual((status, body), (200, {"message": "Bienvenue"}))
+        user = {"email": "bob@x.io", "password": "secret"}
+        status, _, body = await self.request('POST', '/users', user)
+        self.assertEqual((status, body), (200, {"email": "bob@x.io",
+                                                "message": "user created"}))
+        status, _, _ = await self.request('POST', '/users', user)
+        self.assertEqual(status, 400)
+        status, _, _ = await self.request('POST', '/sessions', dict(
+            user, password="wrong"))
+        self.assertEqual(status, 401)
+        self.assertEqual(self.cookies, {})
+        status, _, _ = await self.request('POST', '/sessions', user)
+        self.assertEqual(status, 200)
+        self.assertIn('session_id', self.cookies)
+        for _ in range(2):
+            status, _, body = await self.request('GET', '/profile/')
+            self.assertEqual((status, body), (200, {"email": "bob@x.io"}))
+
+        status, _, body = await self.request('POST', '/reset_password',
+                                             {"email": "bob@x.io"})
+        self.assertEqual(status, 200)
+        form = {"email": "bob@x.io", "reset_token": body["reset_token"],
+                "new_password": "changed"}
+        status, _, _ = await self.request('PUT', '/reset_password', dict(
+            form, reset_token="bad"))
+        self.assertEqual(status, 403)
+        status, _, body = await self.request('PUT', '/reset_password', form)
+        self.assertEqual((status, body), (200, {
+            "email": "bob@x.io", "message": "Password updated"}))
+
+        status, headers, _ = await self.request('DELETE', '/sessions')
+        self.assertEqual((status, headers['location']), (302, "/"))
+        status, _, _ = await self.request('GET', '/profile')
+        self.assertEqual(status, 403)
+        status, _, _ = await self.request('POST', '/sessions', user)
+        self.assertEqual(status, 401)
+        status, _, _ = await self.request('POST', '/sessions', dict(
+            user, password="changed"))
+        self.assertEqual(status, 200)
+
+    async def test_errors(self):
+        """ unknown paths, other methods and large bodies
+        """
+        status, _, _ = await self.request('GET', '/missing')
+        self.assertEqual(status, 404)
+        status, _, _ = await self.request('PATCH', '/sessions')
+        self.assertEqual(status, 405)
+        status, _, _ = await self.request('POST', '/users', {
+            "email": "x" * asgi_app.MAX_BODY})
+        self.assertEqual(status, 413)
+
+    async def test_pool_saturated(self):
+        """ A hash not done within the timeout of the pool answers 503
+            with Retry-After, and so do the calls finding the pool full
+        """
+        pool = HashPool(1, 0, 0.01, rounds=14)
+        self.addCleanup(pool.shutdown)
+        with mock.patch.object(asgi_app, 'HASH_POOL', pool):
+            for email in ("bob@x.io", "eve@x.io"):
+                status, headers, body = await self.request(
+                    'POST', '/users', {"email": email, "password": "secret"})
+                self.assertEqual(status, 503)
+                self.assertEqual(body, {"message": "service busy, retry "
+                                                   "later"})
+                self.assertGreaterEqual(int(headers['retry-after']), 1)
+            self.assertEqual(pool.stats()["rejected"], 1)
+
+    async def test_lifespan(self):
+        """ the server shutdown stops the executors
+        """
+        executor = ThreadPoolExecutor(1)
+        messages = [{'type': 'lifespan.startup'},
+                    {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+        with mock.patch.object(asgi_app, 'DB_EXECUTOR', executor), \
+                mock.patch.object(asgi_app.HASH_POOL, 'shutdown') as shutdown:
+            await asyncio.wait_for(asgi_app.app({'type': 'lifespan'},
+                                                receive, send), 10)
+        self.assertEqual(sent, ['lifespan.startup.complete',
+                                'lifespan.shutdown.complete'])
+        shutdown.assert_called_once_with()
+        with self.assertRaises(RuntimeError):
+            executor.submit(print)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+""" Tests of the DB module
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from contextlib import closing
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import (IntegrityError,  # noqa: E402
+                            InvalidRequestError)
+from sqlalchemy.orm.exc import NoResultFound  # noqa: E402
+
+from db import DB, production_engine  # noqa: E402
+
+
+class ProductionEngineTest(unittest.TestCase):
+    """ production_engine on in-memory and file SQLite
+    """
+
+    def test_in_memory(self):
+        """ Both in-memory URLs work, with one database for all threads
+        """
+        for url in ("sqlite://", "sqlite:///:memory:"):
+            engine = production_engine(url)
+            self.addCleanup(engine.dispose)
+            with engine.begin() as connection:
+                connection.execute(text("CREATE TABLE t (x INTEGER)"))
+                connection.execute(text("INSERT INTO t VALUES (1)"))
+            counts = []
+
+            def count():
+                """ read the table from another thread
+                """
+                with engine.connect() as connection:
+                    counts.append(connection.execute(
+                        text("SELECT COUNT(*) FROM t")).scalar())
+            thread = threading.Thread(target=count)
+            thread.start()
+            thread.join()
+            self.assertEqual(counts, [1], url)
+
+    def test_file_pool(self):
+        """ A database file gets a pool sized by AUTH_DB_POOL_*
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        url = "sqlite:///" + os.path.join(directory.name, "a.db")
+        with mock.patch.dict(os.environ, {'AUTH_DB_POOL_SIZE': '3',
+                                          'AUTH_DB_MAX_OVERFLOW': '2',
+                                          'AUTH_DB_POOL_TIMEOUT': '4'}):
+            engine = production_engine(url)
+        self.addCleanup(engine.dispose)
+        self.assertEqual(engine.pool.size(), 3)
+        self.assertEqual(engine.pool._max_overflow, 2)
+        self.assertEqual(engine.pool._timeout, 4)
+        with engine.connect() as connection:
+            self.assertEqual(connection.execute(
+                text("PRAGMA journal_mode")).scalar(), "wal")
+
+
+class ProductionDBTest(unittest.TestCase):
+    """ DB in production mode on a database file
+    """
+
+    def setUp(self):
+        """ AUTH_DB_URL points to a new database file
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "a.db")
+        patcher = mock.patch.dict(os.environ,
+                                  {'AUTH_DB_URL': "sqlite:///" + self.path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def db(self, production: bool = True) -> DB:
+        """ A DB disposed of at the end of the test
+        """
+        db = DB(production)
+        self.addCleanup(db._engine.dispose)
+        self.addCleanup(db.remove_session)
+        return db
+
+    def test_scoped_sessions(self):
+        """ Each thread gets its own session, remove_session ends it
+        """
+        db = self.db()
+        user = db.add_user("bob@x.io", "hash")
+        session = db._session
+        self.assertIs(db._session, session)
+        seen = []
+
+        def work():
+            """ find the user from another thread
+            """
+            seen.append((db._session, db.find_user_by(id=user.id).email))
+            db.remove_session()
+        thread = threading.Thread(target=work)
+        thread.start()
+        thread.join()
+        self.assertIsNot(seen[0][0], session)
+        self.assertEqual(seen[0][1], "bob@x.io")
+        db.remove_session()
+        self.assertIsNot(db._session, session)
+        self.assertEqual(db.find_user_by(email="bob@x.io").id, user.id)
+
+    def test_schema_kept(self):
+        """ Users survive a restart in production mode, not otherwise
+        """
+        self.db().add_user("bob@x.io", "hash")
+        self.assertEqual(self.db().find_user_by(email="bob@x.io").email,
+                         "bob@x.io")
+        db = self.db(production=False)
+        self.assertFalse(db.production)
+        with self.assertRaises(NoResultFound):
+            db.find_user_by(email="bob@x.io")
+
+
+    def test_indexes_added(self):
+        """ The unique indexes are added to a database created without
+            them, its users are kept
+        """
+        with closing(sqlite3.connect(self.path)) as connection:
+            connection.execute(
+                "CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, "
+                "email VARCHAR(250) NOT NULL, "
+                "hashed_password VARCHAR(250) NOT NULL, "
+                "session_id VARCHAR(250), reset_token VARCHAR(250))")
+            connection.execute("INSERT INTO users (email, hashed_password) "
+                               "VALUES ('bob@x.io', 'hash')")
+            connection.commit()
+        for _ in range(2):
+            db = self.db()
+            db.remove_session()
+            db._engine.dispose()
+        with closing(sqlite3.connect(self.path)) as connection:
+            indexes = {row[1]: row[2] for row in connection.execute(
+                "PRAGMA index_list(users)")}
+        self.assertEqual(indexes, {"ix_users_session_id": 1,
+                                   "ix_users_reset_token": 1})
+        db = self.db()
+        self.assertEqual(db.find_user_by(email="bob@x.io").id, 1)
+        db.update_user(1, session_id="s")
+        other = db.add_user("eve@x.io", "hash")
+        with self.assertRaises(IntegrityError):
+            db.update_user(other.id, session_id="s")
+
+
+class UpdateUsersTest(unittest.TestCase):
+    """ update_users_by with and without UPDATE ... RETURNING
+    """
+
+    def setUp(self):
+        """ Three users in an in-memory database
+        """
+        with mock.patch.dict(os.environ, {'AUTH_DB_URL': "sqlite://"}):
+            self.db = DB(production=False)
+        self.addCleanup(self.db._engine.dispose)
+        self.ids = [self.db.add_user(email, "hash").id
+                    for email in ("a@x.io", "b@x.io", "c@x.io")]
+        self.db.update_user(self.ids[0], session_id="s")
+
+    def session_ids(self) -> list:
+        """ session_id of the users, by id
+        """
+        self.db._session.expire_all()
+        return [self.db.find_user_by(id=i).session_id for i in self.ids]
+
+    def test_update(self):
+        """ Matching users are updated and their ids returned
+        """
+        self.assertEqual(self.db.update_users_by(
+            {'email': ["a@x.io", "c@x.io", "z@x.io"]}, hashed_password="h"),
+            [self.ids[0], self.ids[2]])
+        self.assertEqual(self.db.update_users_by({'email': "z@x.io"},
+                                                 session_id="z"), [])
+        self.assertEqual(self.db.update_user_by({'session_id': "s"},
+                                                session_id=None),
+                         self.ids[0])
+        self.assertEqual(self.session_ids(), [None, None, None])
+        with self.assertRaises(NoResultFound):
+            self.db.update_user_by({'session_id': "s"}, session_id=None)
+
+    def test_rejected(self):
+        """ An empty where or a None value would update other users
+        """
+        for where in ({}, {'session_id': None},
+                      {'session_id': ["s", None]}, {'email': ("a@x.io",
+                                                              None)}):
+            with self.assertRaises(ValueError, msg=where):
+                self.db.update_users_by(where, session_id="x")
+        with self.assertRaises(ValueError):
+            self.db.update_users_by({'id': self.ids[1]}, unknown="x")
+        with self.assertRaises(InvalidRequestError):
+            self.db.update_users_by({'unknown': "x"}, session_id="x")
+        self.assertEqual(self.session_ids(), ["s", None, None])
+
+    def test_without_returning(self):
+        """ Without RETURNING, the ids are selected before the update
+        """
+        dialect = self.db._engine.dialect
+        with mock.patch.object(dialect, 'update_returning', False):
+            self.assertEqual(self.db.update_users_by(
+                {'email': ["b@x.io", "c@x.io"]}, session_id=None,
+                hashed_password="h"), self.ids[1:])
+            self.assertEqual(self.db.update_users_by(
+                {'id': self.ids[1], 'session_id': "s"}, session_id="x"),
+                [])
+            self.assertEqual(self.db.update_user_by(
+                {'session_id': "s"}, session_id="y"), self.ids[0])
+            with self.assertRaises(NoResultFound):
+                self.db.update_user_by({'session_id': "s"}, session_id="y")
+        self.assertEqual(self.session_ids(), ["y", None, None])
+        self.assertEqual(self.db.find_user_by(id=self.ids[2]).hashed_password,
+                         "h")
+
+
+if __name__ == "__main__":
+    unittest.main()
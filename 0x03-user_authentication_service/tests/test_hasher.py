@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+""" Tests of the bcrypt hashing pool
+"""
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# cheap hashes, no calibration when hasher is imported
+os.environ['BCRYPT_ROUNDS'] = '4'
+
+import bcrypt  # noqa: E402
+from hasher import HASH_POOL, HashPool, PoolSaturated  # noqa: E402
+
+
+class HashPoolTest(unittest.TestCase):
+    """ HashPool with worker processes and inline
+    """
+
+    def pool(self, *args) -> HashPool:
+        """ A pool shut down at the end of the test
+        """
+        pool = HashPool(*args)
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def wait_idle(self, pool: HashPool):
+        """ Wait for the calls in progress to end
+        """
+        deadline = time.monotonic() + 10
+        while pool.stats()["in_flight"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(pool.stats()["in_flight"], 0)
+
+    def test_hash_and_check(self):
+        """ Hashes have the cost of the pool and check their password
+        """
+        for workers in (1, 0):
+            pool = self.pool(workers, 1, 10, 5)
+            hashed = pool.hash_password(b"secret")
+            self.assertTrue(hashed.startswith(b"$2b$05$"))
+            self.assertTrue(pool.check_password(b"secret", hashed))
+            self.assertFalse(pool.check_password(b"other", hashed))
+            self.assertEqual(pool.stats()["completed"], 3)
+
+    def test_backpressure(self):
+        """ Beyond workers + queue_size calls, PoolSaturated at once
+        """
+        pool = self.pool(1, 1, 10, 4)
+        futures = [pool._submit(time.sleep, 0.3) for _ in range(2)]
+        start = time.monotonic()
+        with self.assertRaises(PoolSaturated) as raised:
+            pool.hash_password(b"secret")
+        self.assertLess(time.monotonic() - start, 0.2)
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(pool.stats()["rejected"], 1)
+        for future in futures:
+            future.result()
+        self.wait_idle(pool)
+        self.assertTrue(pool.hash_password(b"secret"))
+
+    def test_timeout_keeps_slot(self):
+        """ A call slower than the timeout raises PoolSaturated, and
+            keeps its slot until it really ends
+        """
+        pool = self.pool(1, 0, 0.05, 4)
+        with self.assertRaises(PoolSaturated):
+            pool._run(time.sleep, 0.5)
+        self.assertEqual(pool.stats()["in_flight"], 1)
+        with self.assertRaises(PoolSaturated):
+            pool._run(time.sleep, 0)
+        self.assertEqual(pool.stats()["rejected"], 1)
+        self.wait_idle(pool)
+        pool.timeout = 10
+        self.assertIsNone(pool._run(time.sleep, 0))
+
+    def test_inline_errors_release_slot(self):
+        """ A failing call frees its slot
+        """
+        pool = self.pool(0, 0, 10, 4)
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                pool._run(int, "not a number")
+        self.assertEqual(pool.stats()["in_flight"], 0)
+
+
+class NeedsRehashTest(unittest.TestCase):
+    """ Rehash on login only raises the cost
+    """
+
+    def test_needs_rehash(self):
+        """ Only hashes with a lower cost than the pool's need a rehash
+        """
+        pool = HashPool(0, 0, 10, 5)
+        for rounds, expected in ((4, True), (5, False), (6, False)):
+            hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds))
+            self.assertEqual(pool.needs_rehash(hashed), expected)
+
+    def test_login_upgrades_cost(self):
+        """ A login rewrites a weaker hash, never a stronger one
+        """
+        os.environ['AUTH_DB_URL'] = 'sqlite://'
+        os.environ.pop('AUTH_DB_MODE', None)
+        from auth import Auth
+
+        auth = Auth()
+        for email, rounds, stored in (("weak@example.com", 4, 5),
+                                      ("strong@example.com", 6, 6)):
+            hashed = bcrypt.hashpw(b"secret", bcrypt.gensalt(rounds))
+            auth._db.add_user(email, hashed)
+            with mock.patch.object(HASH_POOL, 'rounds', 5):
+                self.assertTrue(auth.valid_login(email, "secret"))
+            user = auth._db.find_user_by(email=email)
+            self.assertEqual(int(user.hashed_password.split(b"$")[2]),
+                             stored)
+            self.assertTrue(auth.valid_login(email, "secret"))
+
+
+if __name__ == "__main__":
+    unittest.main()
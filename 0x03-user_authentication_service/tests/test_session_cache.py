@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+""" Tests of the session cache and its invalidation by Auth
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# cheap hashes on the calling thread
+os.environ['BCRYPT_ROUNDS'] = '4'
+os.environ['HASH_POOL_WORKERS'] = '0'
+os.environ.pop('AUTH_DB_MODE', None)
+os.environ.pop('SESSION_CACHE_ADDRESS', None)
+
+from auth import Auth  # noqa: E402
+from session_cache import SessionCache, session_cache  # noqa: E402
+
+
+class SessionCacheTest(unittest.TestCase):
+    """ LRU, TTL and invalidation of SessionCache
+    """
+
+    def test_get_put(self):
+        """ Cached sessions are hits, others misses
+        """
+        cache = SessionCache(10, 60)
+        cache.put("s1", 1, "bob@x.io")
+        self.assertEqual(cache.get("s1"), (1, "bob@x.io"))
+        self.assertIsNone(cache.get("s2"))
+        self.assertEqual(cache.stats(), {"size": 1, "max_size": 10,
+                                         "hits": 1, "misses": 1})
+
+    def test_bounds(self):
+        """ Least recently used entries and expired ones are dropped
+        """
+        cache = SessionCache(2, 60)
+        cache.put("s1", 1, "a@x.io")
+        cache.put("s2", 2, "b@x.io")
+        cache.get("s1")
+        cache.put("s3", 3, "c@x.io")
+        self.assertIsNone(cache.get("s2"))
+        self.assertIsNotNone(cache.get("s1"))
+        cache = SessionCache(2, 0.05)
+        cache.put("s1", 1, "a@x.io")
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("s1"))
+        self.assertEqual(cache.stats()["size"], 0)
+        cache = SessionCache(0, 60)
+        cache.put("s1", 1, "a@x.io")
+        self.assertIsNone(cache.get("s1"))
+
+    def test_invalidate(self):
+        """ A session, or all the sessions of a user, are forgotten
+        """
+        cache = SessionCache(10, 60)
+        cache.put("s1", 1, "a@x.io")
+        cache.put("s2", 1, "a@x.io")
+        cache.put("s3", 2, "b@x.io")
+        cache.invalidate("s1")
+        self.assertIsNone(cache.get("s1"))
+        cache.invalidate_user(1)
+        self.assertIsNone(cache.get("s2"))
+        self.assertEqual(cache.get("s3"), (2, "b@x.io"))
+
+
+class SessionCacheSettingsTest(unittest.TestCase):
+    """ session_cache() from the environment
+    """
+
+    def test_single_worker(self):
+        """ The cache is on by default with a single worker only
+        """
+        with mock.patch.dict(os.environ):
+            os.environ.pop('SESSION_CACHE_SIZE', None)
+            os.environ.pop('WEB_CONCURRENCY', None)
+            self.assertEqual(session_cache().size, 10000)
+            os.environ['WEB_CONCURRENCY'] = '1'
+            self.assertEqual(session_cache().size, 10000)
+            os.environ['WEB_CONCURRENCY'] = '4'
+            self.assertEqual(session_cache().size, 0)
+            os.environ['SESSION_CACHE_SIZE'] = '50'
+            os.environ['SESSION_CACHE_TTL'] = '2'
+            cache = session_cache()
+        self.assertEqual((cache.size, cache.ttl), (50, 2))
+
+    def test_authkey_required(self):
+        """ No connection to the shared cache without an authkey
+        """
+        with mock.patch.dict(os.environ,
+                             {'SESSION_CACHE_ADDRESS': '127.0.0.1:1'}):
+            os.environ.pop('SESSION_CACHE_AUTHKEY', None)
+            with self.assertRaises(RuntimeError):
+                session_cache()
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "session_cache.py"),
+             "serve"], env=dict(os.environ, SESSION_CACHE_ADDRESS="1"),
+            capture_output=True, timeout=30)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn(b"SESSION_CACHE_AUTHKEY", result.stderr)
+
+
+class AuthInvalidationTest(unittest.TestCase):
+    """ Logouts and password resets through two workers sharing a
+        database file
+    """
+
+    def setUp(self):
+        """ A database file in production mode
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.dict(os.environ, {
+            'AUTH_DB_URL': "sqlite:///" + os.path.join(directory.name,
+                                                       "a.db")})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        os.environ.pop('SESSION_CACHE_SIZE', None)
+        os.environ.pop('WEB_CONCURRENCY', None)
+
+    def auth(self) -> Auth:
+        """ An Auth (a worker) disposed of at the end of the test
+        """
+        auth = Auth(production=True)
+        self.addCleanup(auth._db._engine.dispose)
+        self.addCleanup(auth._db.remove_session)
+        return auth
+
+    def login(self, auth: Auth) -> str:
+        """ register bob and open a session, cached by auth
+        """
+        user = auth.register_user("bob@x.io", "secret")
+        session_id = auth.create_session("bob@x.io")
+        self.assertEqual(auth.get_session_user(session_id),
+                         (user.id, "bob@x.io"))
+        self.assertEqual(auth._sessions.stats()["size"], 1)
+        return session_id
+
+    def test_logout(self):
+        """ A logout invalidates the cache of its worker
+        """
+        auth = self.auth()
+        session_id = self.login(auth)
+        self.assertTrue(auth.destroy_session_by_session_id(session_id))
+        self.assertEqual(auth._sessions.stats()["size"], 0)
+        self.assertIsNone(auth.get_session_user(session_id))
+        self.assertFalse(auth.destroy_session_by_session_id(session_id))
+
+    def test_password_reset(self):
+        """ A password reset drops the cached sessions of the user, they
+            are read from the database again
+        """
+        auth = self.auth()
+        session_id = self.login(auth)
+        auth.update_password(auth.get_reset_password_token("bob@x.io"),
+                             "new secret")
+        self.assertEqual(auth._sessions.stats()["size"], 0)
+        misses = auth._sessions.stats()["misses"]
+        self.assertIsNotNone(auth.get_session_user(session_id))
+        self.assertEqual(auth._sessions.stats()["misses"], misses + 1)
+        self.assertTrue(auth.valid_login("bob@x.io", "new secret"))
+
+    def test_new_session(self):
+        """ A new login ends the cached previous session
+        """
+        auth = self.auth()
+        session_id = self.login(auth)
+        new_session_id = auth.create_session("bob@x.io")
+        self.assertIsNone(auth.get_session_user(session_id))
+        self.assertIsNotNone(auth.get_session_user(new_session_id))
+
+    def test_several_workers(self):
+        """ With several workers, a logout on one is seen at once by the
+            others: no cache in the process by default
+        """
+        os.environ['WEB_CONCURRENCY'] = '2'
+        auth, other = self.auth(), self.auth()
+        user = auth.register_user("bob@x.io", "secret")
+        session_id = auth.create_session("bob@x.io")
+        self.assertEqual(other.get_session_user(session_id),
+                         (user.id, "bob@x.io"))
+        self.assertTrue(auth.destroy_session_by_session_id(session_id))
+        self.assertIsNone(other.get_session_user(session_id))
+
+    def test_shared_cache(self):
+        """ The workers of a shared cache see the logouts of each other
+        """
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        os.environ['SESSION_CACHE_ADDRESS'] = str(port)
+        os.environ['SESSION_CACHE_AUTHKEY'] = "test key"
+        server = subprocess.Popen([sys.executable,
+                                   os.path.join(ROOT, "session_cache.py"),
+                                   "serve"])
+        self.addCleanup(server.wait)
+        self.addCleanup(server.terminate)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port)).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        auth, other = self.auth(), self.auth()
+        user = auth.register_user("bob@x.io", "secret")
+        session_id = auth.create_session("bob@x.io")
+        self.assertEqual(other.get_session_user(session_id),
+                         (user.id, "bob@x.io"))
+        self.assertEqual(auth._sessions.stats()["size"], 1)
+        self.assertTrue(auth.destroy_session_by_session_id(session_id))
+        self.assertEqual(other._sessions.stats()["size"], 0)
+        self.assertIsNone(other.get_session_user(session_id))
+
+
+if __name__ == "__main__":
+    unittest.main()
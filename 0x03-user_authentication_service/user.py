@@ -18,8 +18,9 @@ class User(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     email = Column(String(250), nullable=False, unique=True)
     hashed_password = Column(String(250), nullable=False)
-    session_id = Column(String(250), nullable=True)
-    reset_token = Column(String(250), nullable=True)
+    # looked up on every authenticated request / password reset
+    session_id = Column(String(250), nullable=True, index=True, unique=True)
+    reset_token = Column(String(250), nullable=True, index=True, unique=True)
 
     def __init__(self, email: str, hashed_password: str,
                  session_id: str = None, reset_token: str = None):